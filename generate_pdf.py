@@ -4,215 +4,233 @@ Install: pip install weasyprint
 """
 
 from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
+from jinja2 import Environment, FileSystemLoader
+import functools
+import hashlib
 import os
+import shutil
+import subprocess
+from pathlib import Path
 
 
-def generate_arabic_math_pdf():
+BASE_DIR = Path(__file__).resolve().parent
+
+# Self-hosted fonts (no network fetch at render time). The Bold face is the
+# wght=700 instance of the variable Regular file, used for headings and <strong>
+FONT_FILE = BASE_DIR / "NotoSansArabic-Regular.ttf"
+BOLD_FONT_FILE = BASE_DIR / "NotoSansArabic-Bold.ttf"
+
+
+def subset_font(text, font_file=FONT_FILE):
+    """
+    Subset a bundled Noto Sans Arabic face to the characters used in text.
+    Uses hb-subset when available; the subset is cached next to the font.
+    Falls back to the full font otherwise.
+    """
+    if shutil.which("hb-subset") is None:
+        return font_file
+    
+    codepoints = sorted(set(ord(c) for c in text))
+    digest = hashlib.sha1(",".join(map(str, codepoints)).encode()).hexdigest()[:12]
+    subset_file = font_file.with_name(f"{font_file.stem}.{digest}.ttf")
+    
+    if not subset_file.exists():
+        unicodes = ",".join(f"{cp:X}" for cp in codepoints)
+        subprocess.run(
+            ["hb-subset", str(font_file), f"--unicodes={unicodes}", f"--output-file={subset_file}"],
+            check=True
+        )
+    
+    return subset_file
+
+
+# Templates are compiled once by Jinja2 and reused for every document
+_ENV = Environment(
+    loader=FileSystemLoader(str(BASE_DIR / "templates")),
+    autoescape=True,
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+
+PROGRAM_DATA = {
+    "header": [
+        "الجمهورية الجزائرية الديمقراطية الشعبية",
+        "وزارة التربية الوطنية",
+    ],
+    "title": "البرنامج السنوي لمادة الرياضيات",
+    "subtitle": "السنة الثالثة ثانوي - شعبة العلوم التجريبية",
+    "school_year": "السنة الدراسية 2024-2025",
+    "introduction": (
+        "يهدف هذا البرنامج إلى تمكين تلاميذ السنة الثالثة ثانوي من اكتساب المفاهيم الرياضية الأساسية "
+        "وتطوير قدراتهم على التفكير المنطقي والاستدلال الرياضي. يشمل البرنامج عدة محاور أساسية تغطي "
+        "مختلف فروع الرياضيات بما يتناسب مع متطلبات شعبة العلوم التجريبية والتحضير لامتحان البكالوريا."
+    ),
+    "terms": [
+        {
+            "title": "الفصل الأول (سبتمبر - ديسمبر)",
+            "units": [
+                {
+                    "title": "الوحدة الأولى: الدوال العددية",
+                    "topics": [
+                        "دراسة الدوال وتمثيلها البياني",
+                        "النهايات والاستمرارية",
+                        "الاشتقاقية وتطبيقاتها",
+                        "دراسة تغيرات الدوال والتمثيل البياني",
+                    ],
+                    "duration": "5 أسابيع (20 ساعة)",
+                },
+                {
+                    "title": "الوحدة الثانية: الدوال الأسية واللوغاريتمية",
+                    "topics": [
+                        "تعريف الدالة الأسية وخصائصها",
+                        "الدالة اللوغاريتمية النيبيرية",
+                        "المعادلات والمتراجحات الأسية واللوغاريتمية",
+                        "التطبيقات في العلوم الطبيعية والفيزيائية",
+                    ],
+                    "duration": "4 أسابيع (16 ساعة)",
+                },
+                {
+                    "title": "الوحدة الثالثة: المتتاليات العددية",
+                    "topics": [
+                        "تعريف المتتالية ودراسة سلوكها",
+                        "المتتاليات الحسابية والهندسية",
+                        "النهايات والمتتاليات المتقاربة",
+                        "الاستدلال بالتراجع",
+                    ],
+                    "duration": "3 أسابيع (12 ساعة)",
+                },
+            ],
+        },
+        {
+            "title": "الفصل الثاني (يناير - مارس)",
+            "units": [
+                {
+                    "title": "الوحدة الرابعة: الحساب التكاملي",
+                    "topics": [
+                        "التكامل غير المحدود والدوال الأصلية",
+                        "التكامل المحدود وخصائصه",
+                        "حساب المساحات والحجوم",
+                        "التكامل بالتجزئة والتكامل بالتعويض",
+                    ],
+                    "duration": "5 أسابيع (20 ساعة)",
+                },
+                {
+                    "title": "الوحدة الخامسة: الأعداد المركبة",
+                    "topics": [
+                        "مجموعة الأعداد المركبة والعمليات عليها",
+                        "الشكل الجبري والشكل المثلثي",
+                        "حل المعادلات في مجموعة الأعداد المركبة",
+                        "التطبيقات الهندسية للأعداد المركبة",
+                    ],
+                    "duration": "4 أسابيع (16 ساعة)",
+                },
+                {
+                    "title": "الوحدة السادسة: الهندسة في الفضاء",
+                    "topics": [
+                        "المستقيمات والمستويات في الفضاء",
+                        "الأشعة والإحداثيات في الفضاء",
+                        "الجداء السلمي في الفضاء",
+                        "المعادلات الديكارتية والوسيطية",
+                    ],
+                    "duration": "3 أسابيع (12 ساعة)",
+                },
+            ],
+        },
+        {
+            "title": "الفصل الثالث (أبريل - يونيو)",
+            "page_break_before": True,
+            "units": [
+                {
+                    "title": "الوحدة السابعة: الاحتمالات",
+                    "topics": [
+                        "مفاهيم أساسية في الاحتمالات",
+                        "الاحتمال الشرطي والاستقلالية",
+                        "المتغيرات العشوائية المنفصلة",
+                        "القانون ذو الحدين والتوزيع الطبيعي",
+                    ],
+                    "duration": "4 أسابيع (16 ساعة)",
+                },
+                {
+                    "title": "الوحدة الثامنة: المعادلات التفاضلية",
+                    "topics": [
+                        "تعريف المعادلات التفاضلية من الرتبة الأولى",
+                        "حل المعادلات التفاضلية من الشكل y' = ay + b",
+                        "المعادلات التفاضلية من الرتبة الثانية",
+                        "التطبيقات في الفيزياء والبيولوجيا",
+                    ],
+                    "duration": "3 أسابيع (12 ساعة)",
+                },
+                {
+                    "title": "فترة المراجعة والتحضير للبكالوريا",
+                    "topics": [
+                        "مراجعة شاملة لجميع الوحدات",
+                        "حل نماذج امتحانات البكالوريا السابقة",
+                        "تدريبات مكثفة على حل المسائل",
+                        "تقنيات الامتحان وإدارة الوقت",
+                    ],
+                    "duration": "4 أسابيع (16 ساعة)",
+                },
+            ],
+        },
+    ],
+    "goals": [
+        "تمكين التلاميذ من المفاهيم الرياضية الأساسية اللازمة للتعليم العالي",
+        "تنمية القدرة على التفكير المنطقي والاستدلال الرياضي السليم",
+        "تطوير مهارات حل المشكلات والتحليل الرياضي",
+        "ربط الرياضيات بالمواد العلمية الأخرى وبالحياة اليومية",
+        "التحضير الجيد لامتحان شهادة البكالوريا",
+    ],
+    "methodology": (
+        "يعتمد تدريس البرنامج على المقاربة بالكفاءات التي تجعل التلميذ محور العملية التعليمية. "
+        "يتم التركيز على الأنشطة التطبيقية وحل المسائل المتنوعة مع استخدام الوسائل التكنولوجية "
+        "الحديثة عند الحاجة. كما يتم التنويع في طرق التقويم بين الفروض والاختبارات والأعمال التطبيقية "
+        "لضمان تقييم شامل لمستوى التلاميذ."
+    ),
+    "assessment": [
+        "فرضان محروسان في كل فصل دراسي",
+        "اختبار في نهاية كل فصل",
+        "واجبات منزلية منتظمة",
+        "مشاركة فعالة في القسم",
+        "اختبارات تجريبية للبكالوريا في الفصل الثالث",
+    ],
+    "prepared_by": "قسم الرياضيات",
+    "prepared_on": "سبتمبر 2024",
+}
+
+
+def render_program_html(data):
+    """Render the program template with the given data."""
+    return _ENV.get_template("program.html").render(data=data)
+
+
+@functools.lru_cache(maxsize=None)
+def _stylesheet(font_uri, bold_font_uri):
+    """Parse the stylesheet (and set up its fonts) once per pair of font files."""
+    style = (BASE_DIR / "static" / "arabic.css").read_text(encoding="utf-8")
+    style = style.replace('__FONT_URL__', font_uri).replace('__BOLD_FONT_URL__', bold_font_uri)
+    font_config = FontConfiguration()
+    css = CSS(string=style, font_config=font_config)
+    return css, font_config
+
+
+@functools.lru_cache(maxsize=8)
+def _render(html_content):
+    """Lay out the HTML with the shared stylesheet; the Document is cached."""
+    css, font_config = _stylesheet(
+        subset_font(html_content).as_uri(),
+        subset_font(html_content, BOLD_FONT_FILE).as_uri(),
+    )
+    return HTML(string=html_content).render(stylesheets=[css], font_config=font_config)
+
+
+def generate_arabic_math_pdf(output_file="برنامج_الرياضيات_3AS_صحيح.pdf", data=None):
     """Generate PDF from HTML with proper Arabic support"""
     
-    html_content = """
-<!DOCTYPE html>
-<html dir="rtl" lang="ar">
-<head>
-    <meta charset="UTF-8">
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=Noto+Sans+Arabic:wght@400;700&display=swap');
-        
-        body {
-            font-family: 'Noto Sans Arabic', Arial, sans-serif;
-            direction: rtl;
-            text-align: right;
-            line-height: 1.8;
-            margin: 2cm;
-            font-size: 12pt;
-        }
-        
-        h1 {
-            color: #1a5490;
-            font-size: 20pt;
-            text-align: center;
-            margin-bottom: 1cm;
-            font-weight: bold;
-        }
-        
-        h2 {
-            color: #2c5282;
-            font-size: 16pt;
-            margin-top: 1cm;
-            margin-bottom: 0.5cm;
-            font-weight: bold;
-        }
-        
-        h3 {
-            color: #2d3748;
-            font-size: 14pt;
-            margin-top: 0.5cm;
-            margin-bottom: 0.3cm;
-            font-weight: bold;
-        }
-        
-        .header {
-            text-align: right;
-            margin-bottom: 1cm;
-        }
-        
-        ul {
-            margin-right: 1cm;
-        }
-        
-        li {
-            margin-bottom: 0.3cm;
-        }
-        
-        .duration {
-            font-weight: bold;
-            color: #555;
-        }
-    </style>
-</head>
-<body>
-    <div class="header">
-        <p>الجمهورية الجزائرية الديمقراطية الشعبية</p>
-        <p>وزارة التربية الوطنية</p>
-    </div>
-    
-    <h1>البرنامج السنوي لمادة الرياضيات</h1>
-    <h3 style="text-align: center;">السنة الثالثة ثانوي - شعبة العلوم التجريبية</h3>
-    <p style="text-align: center;">السنة الدراسية 2024-2025</p>
-    
-    <h2>المقدمة</h2>
-    <p>
-        يهدف هذا البرنامج إلى تمكين تلاميذ السنة الثالثة ثانوي من اكتساب المفاهيم الرياضية الأساسية 
-        وتطوير قدراتهم على التفكير المنطقي والاستدلال الرياضي. يشمل البرنامج عدة محاور أساسية تغطي 
-        مختلف فروع الرياضيات بما يتناسب مع متطلبات شعبة العلوم التجريبية والتحضير لامتحان البكالوريا.
-    </p>
-    
-    <h2>الفصل الأول (سبتمبر - ديسمبر)</h2>
-    
-    <h3>الوحدة الأولى: الدوال العددية</h3>
-    <ul>
-        <li>دراسة الدوال وتمثيلها البياني</li>
-        <li>النهايات والاستمرارية</li>
-        <li>الاشتقاقية وتطبيقاتها</li>
-        <li>دراسة تغيرات الدوال والتمثيل البياني</li>
-    </ul>
-    <p class="duration">المدة الزمنية: 5 أسابيع (20 ساعة)</p>
-    
-    <h3>الوحدة الثانية: الدوال الأسية واللوغاريتمية</h3>
-    <ul>
-        <li>تعريف الدالة الأسية وخصائصها</li>
-        <li>الدالة اللوغاريتمية النيبيرية</li>
-        <li>المعادلات والمتراجحات الأسية واللوغاريتمية</li>
-        <li>التطبيقات في العلوم الطبيعية والفيزيائية</li>
-    </ul>
-    <p class="duration">المدة الزمنية: 4 أسابيع (16 ساعة)</p>
-    
-    <h3>الوحدة الثالثة: المتتاليات العددية</h3>
-    <ul>
-        <li>تعريف المتتالية ودراسة سلوكها</li>
-        <li>المتتاليات الحسابية والهندسية</li>
-        <li>النهايات والمتتاليات المتقاربة</li>
-        <li>الاستدلال بالتراجع</li>
-    </ul>
-    <p class="duration">المدة الزمنية: 3 أسابيع (12 ساعة)</p>
-    
-    <h2>الفصل الثاني (يناير - مارس)</h2>
-    
-    <h3>الوحدة الرابعة: الحساب التكاملي</h3>
-    <ul>
-        <li>التكامل غير المحدود والدوال الأصلية</li>
-        <li>التكامل المحدود وخصائصه</li>
-        <li>حساب المساحات والحجوم</li>
-        <li>التكامل بالتجزئة والتكامل بالتعويض</li>
-    </ul>
-    <p class="duration">المدة الزمنية: 5 أسابيع (20 ساعة)</p>
-    
-    <h3>الوحدة الخامسة: الأعداد المركبة</h3>
-    <ul>
-        <li>مجموعة الأعداد المركبة والعمليات عليها</li>
-        <li>الشكل الجبري والشكل المثلثي</li>
-        <li>حل المعادلات في مجموعة الأعداد المركبة</li>
-        <li>التطبيقات الهندسية للأعداد المركبة</li>
-    </ul>
-    <p class="duration">المدة الزمنية: 4 أسابيع (16 ساعة)</p>
-    
-    <h3>الوحدة السادسة: الهندسة في الفضاء</h3>
-    <ul>
-        <li>المستقيمات والمستويات في الفضاء</li>
-        <li>الأشعة والإحداثيات في الفضاء</li>
-        <li>الجداء السلمي في الفضاء</li>
-        <li>المعادلات الديكارتية والوسيطية</li>
-    </ul>
-    <p class="duration">المدة الزمنية: 3 أسابيع (12 ساعة)</p>
-    
-    <div style="page-break-before: always;"></div>
-    
-    <h2>الفصل الثالث (أبريل - يونيو)</h2>
-    
-    <h3>الوحدة السابعة: الاحتمالات</h3>
-    <ul>
-        <li>مفاهيم أساسية في الاحتمالات</li>
-        <li>الاحتمال الشرطي والاستقلالية</li>
-        <li>المتغيرات العشوائية المنفصلة</li>
-        <li>القانون ذو الحدين والتوزيع الطبيعي</li>
-    </ul>
-    <p class="duration">المدة الزمنية: 4 أسابيع (16 ساعة)</p>
-    
-    <h3>الوحدة الثامنة: المعادلات التفاضلية</h3>
-    <ul>
-        <li>تعريف المعادلات التفاضلية من الرتبة الأولى</li>
-        <li>حل المعادلات التفاضلية من الشكل y' = ay + b</li>
-        <li>المعادلات التفاضلية من الرتبة الثانية</li>
-        <li>التطبيقات في الفيزياء والبيولوجيا</li>
-    </ul>
-    <p class="duration">المدة الزمنية: 3 أسابيع (12 ساعة)</p>
-    
-    <h3>فترة المراجعة والتحضير للبكالوريا</h3>
-    <ul>
-        <li>مراجعة شاملة لجميع الوحدات</li>
-        <li>حل نماذج امتحانات البكالوريا السابقة</li>
-        <li>تدريبات مكثفة على حل المسائل</li>
-        <li>تقنيات الامتحان وإدارة الوقت</li>
-    </ul>
-    <p class="duration">المدة الزمنية: 4 أسابيع (16 ساعة)</p>
-    
-    <h2>الأهداف العامة للبرنامج</h2>
-    <ul>
-        <li>تمكين التلاميذ من المفاهيم الرياضية الأساسية اللازمة للتعليم العالي</li>
-        <li>تنمية القدرة على التفكير المنطقي والاستدلال الرياضي السليم</li>
-        <li>تطوير مهارات حل المشكلات والتحليل الرياضي</li>
-        <li>ربط الرياضيات بالمواد العلمية الأخرى وبالحياة اليومية</li>
-        <li>التحضير الجيد لامتحان شهادة البكالوريا</li>
-    </ul>
-    
-    <h2>المنهجية البيداغوجية</h2>
-    <p>
-        يعتمد تدريس البرنامج على المقاربة بالكفاءات التي تجعل التلميذ محور العملية التعليمية. 
-        يتم التركيز على الأنشطة التطبيقية وحل المسائل المتنوعة مع استخدام الوسائل التكنولوجية 
-        الحديثة عند الحاجة. كما يتم التنويع في طرق التقويم بين الفروض والاختبارات والأعمال التطبيقية 
-        لضمان تقييم شامل لمستوى التلاميذ.
-    </p>
-    
-    <h2>التقويم</h2>
-    <ul>
-        <li>فرضان محروسان في كل فصل دراسي</li>
-        <li>اختبار في نهاية كل فصل</li>
-        <li>واجبات منزلية منتظمة</li>
-        <li>مشاركة فعالة في القسم</li>
-        <li>اختبارات تجريبية للبكالوريا في الفصل الثالث</li>
-    </ul>
-    
-    <p style="margin-top: 2cm;">
-        <strong>إعداد:</strong> قسم الرياضيات<br>
-        <strong>تاريخ الإعداد:</strong> سبتمبر 2024
-    </p>
-</body>
-</html>
-"""
+    html_content = render_program_html(data or PROGRAM_DATA)
     
     # Generate PDF
-    output_file = "برنامج_الرياضيات_3AS_صحيح.pdf"
-    HTML(string=html_content).write_pdf(output_file)
+    _render(html_content).write_pdf(output_file)
     
     print(f"✅ Generated: {output_file}")
     print("This PDF has properly encoded Arabic text that will work with Docling!")
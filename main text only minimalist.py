@@ -1,33 +1,61 @@
 from fastapi import FastAPI, UploadFile, File
 import tempfile, os
-import torch
-import PyPDF2
+import re
+from collections import deque
 from io import BytesIO
 
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+    import PyPDF2
+
 app = FastAPI()
 
-def extract_text_with_pypdf2(pdf_content):
-    """Extract text using PyPDF2 as a reliable fallback"""
+def extract_text_with_pymupdf(pdf):
+    """
+    Extract text using PyMuPDF, falling back to PyPDF2 if it is not installed.
+    `pdf` is a file path (preferred, no extra copy in memory) or raw PDF bytes.
+    """
     text_by_page = []
     
     try:
-        pdf_reader = PyPDF2.PdfReader(BytesIO(pdf_content))
+        if fitz is None:
+            source = BytesIO(pdf) if isinstance(pdf, (bytes, bytearray)) else pdf
+            pdf_reader = PyPDF2.PdfReader(source)
+            page_texts = [page.extract_text() or "" for page in pdf_reader.pages]
+        else:
+            if isinstance(pdf, (bytes, bytearray)):
+                doc = fitz.open(stream=pdf, filetype="pdf")
+            else:
+                doc = fitz.open(pdf)
+            with doc:
+                page_texts = [page.get_text("text") for page in doc]
         
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text = page.extract_text()
-            
+        for i, text in enumerate(page_texts):
             if text.strip():  # Only add if there's text
                 text_by_page.append({
-                    "page": page_num + 1,
+                    "page": i + 1,
                     "text": text
                 })
         
         return text_by_page
     except Exception as e:
-        print(f"PyPDF2 extraction error: {e}")
+        print(f"PDF text extraction error: {e}")
         return None
 
+_WORD_RE = re.compile(r'\S+')
+
+def _window_chunk(text, window, page_num):
+    """Slice one chunk out of the page text from a window of word spans"""
+    return {
+        "text": text[window[0][0]:window[-1][1]],
+        "meta": {
+            "page": page_num,
+            "section": None
+        }
+    }
+
 def chunk_text(text_pages, chunk_size=600, overlap=100):
     """Simple text chunking"""
     chunks = []
@@ -36,58 +64,63 @@ def chunk_text(text_pages, chunk_size=600, overlap=100):
         text = page_data["text"]
         page_num = page_data["page"]
         
-        # Simple sliding window chunking
-        words = text.split()
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk_words = words[i:i + chunk_size]
-            if chunk_words:
-                chunk_text = " ".join(chunk_words)
-                chunks.append({
-                    "text": chunk_text,
-                    "meta": {
-                        "page": page_num,
-                        "section": None
-                    }
-                })
+        # Simple sliding window chunking over word offsets
+        step = chunk_size - overlap
+        window = deque()
+        for m in _WORD_RE.finditer(text):
+            window.append(m.span())
+            if len(window) == chunk_size:
+                chunks.append(_window_chunk(text, window, page_num))
+                for _ in range(step):
+                    window.popleft()
+        
+        # Flush the tail like the stride loop did: one more window per
+        # remaining start offset, even if it only repeats the overlap
+        while window:
+            chunks.append(_window_chunk(text, window, page_num))
+            for _ in range(min(step, len(window))):
+                window.popleft()
     
     return chunks
 
 @app.post("/ingest")
 async def ingest(file: UploadFile = File(...)):
-    content = await file.read()
-    
-    # Try PyPDF2 first (most reliable)
-    text_pages = extract_text_with_pypdf2(content)
+    # Stream the upload to disk instead of buffering it in memory
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+        while chunk := await file.read(1 << 20):
+            tmp.write(chunk)
+        path = tmp.name
     
-    if text_pages and any(page["text"].strip() for page in text_pages):
-        chunks = chunk_text(text_pages)
-        
-        return {
-            "success": True,
-            "chunks": chunks,
-            "method": "pypdf2",
-            "total_pages": len(text_pages),
-            "total_chunks": len(chunks)
-        }
-    
-    # If PyPDF2 fails, try docling with layout disabled
     try:
-        # Patch torch.xpu
-        if not hasattr(torch, 'xpu'):
-            torch.xpu = type('XPU', (), {
-                'is_available': lambda: False,
-                'device_count': lambda: 0
-            })()
-        
-        from docling.document_converter import DocumentConverter
-        from docling.chunking import HybridChunker
+        # Try native text extraction first (most reliable)
+        text_pages = extract_text_with_pymupdf(path)
         
-        # Save to temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(content)
-            path = tmp.name
+        if text_pages and any(page["text"].strip() for page in text_pages):
+            chunks = chunk_text(text_pages)
+            
+            return {
+                "success": True,
+                "chunks": chunks,
+                "method": "pymupdf" if fitz is not None else "pypdf2",
+                "total_pages": len(text_pages),
+                "total_chunks": len(chunks)
+            }
         
+        # If text extraction fails, try docling with layout disabled
         try:
+            # Only the docling fallback needs torch, so load it here
+            import torch
+            
+            # Patch torch.xpu
+            if not hasattr(torch, 'xpu'):
+                torch.xpu = type('XPU', (), {
+                    'is_available': staticmethod(lambda: False),
+                    'device_count': staticmethod(lambda: 0)
+                })()
+            
+            from docling.document_converter import DocumentConverter
+            from docling.chunking import HybridChunker
+            
             # Try with layout disabled
             converter = DocumentConverter(do_layout_model=False)
             result = converter.convert(path, raises_on_error=False)
@@ -112,17 +145,17 @@ async def ingest(file: UploadFile = File(...)):
                     "method": "docling_no_layout",
                     "total_chunks": len(chunks)
                 }
-        finally:
-            if os.path.exists(path):
-                os.unlink(path)
-                
-    except Exception as e:
+                    
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"All methods failed: {str(e)}"
+            }
+        
         return {
             "success": False,
-            "error": f"All methods failed: {str(e)}"
+            "error": "Could not extract text from PDF"
         }
-    
-    return {
-        "success": False,
-        "error": "Could not extract text from PDF"
-    }
\ No newline at end of file
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
@@ -1,49 +1,227 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
 import tempfile, os
-from io import BytesIO
-import PyPDF2
+import json
+import functools
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import torch
 import re
 
+# Older torch builds have no torch.xpu, which Docling's device checks expect
+if not hasattr(torch, "xpu"):
+    torch.xpu = type("XPU", (), {
+        "is_available": staticmethod(lambda: False),
+        "device_count": staticmethod(lambda: 0),
+    })()
+
+try:
+    from tesserocr import PyTessBaseAPI, PSM
+except ImportError:
+    PyTessBaseAPI = None
+
 app = FastAPI()
 
 
-def extract_with_ocr(pdf_path):
+# Directional marks/embeddings that Tesseract leaves in Arabic output
+_RTL_STRIP = str.maketrans('', '', '\u200e\u200f\u202a\u202b\u202c\u202d\u202e')
+
+# Per-process Tesseract instance (tesserocr), created on first use in each worker
+_tess_api = None
+
+
+def _get_tess_api():
     """
-    Use OCR to extract text from PDF with proper Arabic support.
-    This is the ONLY reliable way to get clean Arabic text from PDFs.
+    Return this process's Tesseract API so traineddata is loaded only once.
     """
-    try:
-        from pdf2image import convert_from_path
+    global _tess_api
+    if _tess_api is None:
+        _tess_api = PyTessBaseAPI(lang='ara+eng', psm=PSM.SINGLE_BLOCK)
+    return _tess_api
+
+
+def _otsu_threshold(image):
+    """
+    Compute Otsu's binarization threshold from a grayscale image histogram.
+    """
+    hist = image.histogram()
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    
+    sum_bg = weight_bg = 0
+    best_threshold, best_variance = 0, 0.0
+    for t, h in enumerate(hist):
+        weight_bg += h
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += t * h
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = t, variance
+    return best_threshold
+
+
+def _render_page(page, dpi=200):
+    """
+    Rasterize a PyMuPDF page into a binarized PIL image for OCR.
+    """
+    import fitz  # PyMuPDF
+    from PIL import Image
+    
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    
+    threshold = _otsu_threshold(image)
+    return image.point(lambda p: 255 if p > threshold else 0, mode='1')
+
+
+def _ocr_one_page(pdf_path, page_idx, dpi=200):
+    """
+    Render and OCR a single page. Runs in a worker process.
+    """
+    import fitz  # PyMuPDF
+    
+    # Render in-process; the pixmap never leaves this worker
+    with fitz.open(pdf_path) as doc:
+        image = _render_page(doc[page_idx], dpi)
+    
+    # Extract with Arabic + English
+    if PyTessBaseAPI is not None:
+        api = _get_tess_api()
+        api.SetImage(image)
+        text = api.GetUTF8Text()
+    else:
         import pytesseract
+        text = pytesseract.image_to_string(image, lang='ara+eng', config='--psm 6')
+    return text.translate(_RTL_STRIP)
+
+
+def _ocr_all_pages_batched(pdf_path, page_indices, dpi=200):
+    """
+    OCR the given pages with a single tesseract run over an image list-file,
+    so the Arabic/English models are loaded once for the whole document.
+    """
+    import fitz  # PyMuPDF
+    import pytesseract
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_paths = []
+        with fitz.open(pdf_path) as doc:
+            for i in page_indices:
+                page = doc[i]
+                image_path = os.path.join(tmp_dir, f"page_{i:05d}.png")
+                _render_page(page, dpi).save(image_path)
+                image_paths.append(image_path)
         
-        print("🔍 Using Tesseract OCR for Arabic text extraction...")
+        list_path = os.path.join(tmp_dir, "pages.txt")
+        with open(list_path, "w") as f:
+            f.write("\n".join(image_paths) + "\n")
         
-        # Convert PDF to images at good resolution
-        images = convert_from_path(pdf_path, dpi=300)
+        text = pytesseract.image_to_string(list_path, lang='ara+eng', config='--psm 6')
+    
+    # Tesseract ends every page with a form feed
+    texts = text.split('\f')[:len(image_paths)]
+    return [t.translate(_RTL_STRIP) for t in texts]
+
+
+# Pages with less native text than this are OCR'd
+MIN_TEXT_LAYER_CHARS = 50
+
+# C0 control characters show up when a PDF's font has a broken ToUnicode map
+_CONTROL_CHAR_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _text_layer(page):
+    """
+    Return the page's native text if it is usable, or None if it needs OCR.
+    """
+    text = page.get_text("text")
+    stripped = text.strip()
+    
+    if len(stripped) < MIN_TEXT_LAYER_CHARS:
+        return None
+    
+    # Garbled glyph mapping - the text layer cannot be trusted
+    if len(_CONTROL_CHAR_RE.findall(stripped)) > len(stripped) * 0.01:
+        return None
+    
+    # Fold Arabic presentation forms back to regular letters
+    return unicodedata.normalize('NFKC', text).translate(_RTL_STRIP)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_ocr_pool():
+    """
+    Long-lived OCR worker pool, so each worker's Tesseract API (and its
+    traineddata) stays loaded across requests.
+    """
+    return ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 4))
+
+
+def extract_with_ocr(pdf_path, dpi=200):
+    """
+    Extract text from PDF with proper Arabic support.
+    Pages with a clean native text layer are read directly; the rest go
+    through OCR, which is the only reliable way to get clean Arabic text
+    from them. With tesserocr, pages are rendered and recognized in parallel
+    worker processes; otherwise they go through a single tesseract run.
+    """
+    try:
+        import fitz  # PyMuPDF
+        if PyTessBaseAPI is None:
+            import pytesseract
+        
+        with fitz.open(pdf_path) as doc:
+            texts = [_text_layer(page) for page in doc]
+        
+        ocr_indices = [i for i, text in enumerate(texts) if text is None]
+        print(f"📄 {len(texts) - len(ocr_indices)} pages with a usable text layer, {len(ocr_indices)} need OCR")
+        
+        if ocr_indices:
+            print("🔍 Using Tesseract OCR for Arabic text extraction...")
         
+        if not ocr_indices:
+            ocr_texts = []
+        elif PyTessBaseAPI is None and _probe_tesseract()[0].major >= 4:
+            ocr_texts = _ocr_all_pages_batched(pdf_path, ocr_indices, dpi)
+        else:
+            # Convert each page to an image at good resolution and OCR it
+            ocr_texts = list(_get_ocr_pool().map(
+                _ocr_one_page,
+                [pdf_path] * len(ocr_indices),
+                ocr_indices,
+                [dpi] * len(ocr_indices),
+            ))
+        
+        for i, text in zip(ocr_indices, ocr_texts):
+            texts[i] = text
+        
+        ocr_set = set(ocr_indices)
         pages = []
-        for i, image in enumerate(images):
-            # Extract with Arabic + English
-            text = pytesseract.image_to_string(image, lang='ara+eng', config='--psm 6')
-            text = re.sub(r'[\u200e\u200f]', '', text)
-            
+        for i, text in enumerate(texts):
             if text.strip():
                 pages.append({
                     "page": i + 1,
-                    "text": text.strip()
+                    "text": text.strip(),
+                    "source": "ocr" if i in ocr_set else "text_layer"
                 })
                 
                 if i == 0:  # Show first page sample
-                    print(f"\n📄 OCR Sample (Page 1):\n{text[:400]}\n")
+                    print(f"\n📄 Sample (Page 1):\n{text[:400]}\n")
         
-        print(f"✅ OCR extracted {len(pages)} pages")
+        print(f"✅ Extracted {len(pages)} pages")
         return pages
         
     except ImportError as e:
         print(f"❌ OCR libraries missing: {e}")
         print("\nInstall with:")
-        print("  pip install pytesseract pdf2image pillow")
+        print("  pip install pytesseract pymupdf pillow")
         print("\nAnd install Tesseract:")
         print("  Ubuntu/Debian: sudo apt-get install tesseract-ocr tesseract-ocr-ara")
         print("  macOS: brew install tesseract tesseract-lang")
@@ -54,6 +232,24 @@ def extract_with_ocr(pdf_path):
         return None
 
 
+# Keywords that indicate headings
+_SECTION_KEYWORDS = [
+    'الوحدة', 'وحدة',
+    'الفصل', 'فصل', 
+    'المقدمة', 'مقدمة',
+    'الخاتمة', 'الأهداف', 'أهداف',
+    'المنهجية', 'منهجية',
+    'التقويم', 'تقويم',
+    'الباب', 'القسم', 'الجزء',
+    'فترة المراجعة',
+]
+
+_SECTION_KW_RE = re.compile('|'.join(map(re.escape, _SECTION_KEYWORDS)))
+
+# Pattern: "الوحدة الأولى:" or "1. Something"
+_SECTION_ORDINAL_RE = re.compile(r'^(الوحدة|الفصل|الباب).+(الأول|الثان|الثالث|الرابع|الخامس|السادس|السابع|الثامن)')
+
+
 def is_section_heading(line):
     """
     Detect Arabic section headings - simple and robust.
@@ -63,26 +259,10 @@ def is_section_heading(line):
     if not line or len(line) > 200:
         return False
     
-    # Keywords that indicate headings
-    section_keywords = [
-        'الوحدة', 'وحدة',
-        'الفصل', 'فصل', 
-        'المقدمة', 'مقدمة',
-        'الخاتمة', 'الأهداف', 'أهداف',
-        'المنهجية', 'منهجية',
-        'التقويم', 'تقويم',
-        'الباب', 'القسم', 'الجزء',
-        'فترة المراجعة',
-    ]
-    
-    line_clean = line.lower().replace('ا', 'ا').replace('إ', 'ا')
-    
-    for keyword in section_keywords:
-        if keyword in line_clean:
-            return True
+    if _SECTION_KW_RE.search(line.replace('إ', 'ا')):
+        return True
     
-    # Pattern: "الوحدة الأولى:" or "1. Something"
-    if re.match(r'^(الوحدة|الفصل|الباب).+(الأول|الثان|الثالث|الرابع|الخامس|السادس|السابع|الثامن)', line):
+    if _SECTION_ORDINAL_RE.match(line):
         return True
     
     # Short lines with colons (often titles)
@@ -92,116 +272,172 @@ def is_section_heading(line):
     return False
 
 
-def extract_sections_from_pages(pages):
+_WORD_RE = re.compile(r'\S+')
+_LINE_RE = re.compile(r'[^\n]+')
+
+
+def _window_chunk(text, window, page_num):
     """
-    Extract all section headings from pages.
+    Build an enriched chunk from a window of (start, end, section) word spans.
+    The chunk takes the last section whose word starts within its first 400 chars.
     """
-    sections = []
+    start_char = window[0][0]
+    limit = start_char + 400
     
-    for page in pages:
-        lines = page["text"].split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if is_section_heading(line):
-                # Clean up bullets and extra spaces
-                section = re.sub(r'^[•\-\*]\s*', '', line)
-                section = re.sub(r'\s+', ' ', section).strip()
-                
-                if section and len(section) > 3:
-                    sections.append(section)
-                    print(f"  📌 Found section: {section}")
+    section = window[0][2]
+    for word_start, _, word_section in window:
+        if word_start >= limit:
+            break
+        section = word_section
     
-    return sections
+    return {
+        "text": text[start_char:window[-1][1]],
+        "meta": {
+            "page": page_num,
+            "section": section
+        }
+    }
 
 
-def chunk_text_pages(pages, chunk_size=600, overlap=100):
+def extraction_summary(pages):
     """
-    Chunk pages into smaller pieces.
+    Describe how the pages were read: method, per-source page counts and a note.
     """
-    chunks = []
+    ocr_pages = sum(1 for page in pages if page["source"] == "ocr")
+    text_layer_pages = len(pages) - ocr_pages
     
-    for page in pages:
-        text = page["text"]
-        words = text.split()
-        
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk_words = words[i:i + chunk_size]
-            if chunk_words:
-                chunks.append({
-                    "text": " ".join(chunk_words),
-                    "page": page["page"]
-                })
+    if not ocr_pages:
+        method = "text_layer"
+        note = "Text read from the PDF's native text layer (no OCR needed)"
+    elif not text_layer_pages:
+        method = "ocr_tesseract"
+        note = "Text extracted using OCR for proper Arabic support"
+    else:
+        method = "text_layer+ocr_tesseract"
+        note = "Clean pages read from the text layer, the rest extracted using OCR"
     
-    return chunks
+    return {
+        "method": method,
+        "ocr_pages": ocr_pages,
+        "text_layer_pages": text_layer_pages,
+        "note": note,
+    }
 
 
-def assign_sections_smart(chunks, sections):
+def iter_enriched_chunks(pages, sections, chunk_size=600, overlap=100):
     """
-    Assign sections to chunks intelligently.
-    """
-    if not sections:
-        print("⚠️ No sections found - using page numbers")
-        return [{
-            "text": c["text"],
-            "meta": {
-                "page": c["page"],
-                "section": f"صفحة {c['page']}"
-            }
-        } for c in chunks]
+    Detect section headings, chunk the text and assign sections in a single
+    pass over the pages, yielding enriched chunks as they are produced.
+    Detected headings are appended to `sections` along the way.
     
-    enriched = []
-    current_section = sections[0]
+    A chunk gets the last section whose heading starts before the end of the
+    chunk's first 400 characters. Chunks before the first heading fall back to
+    the first section, so they are held back until it is found (or to their
+    page number when no headings are found at all).
+    """
+    pending = []
+    current_section = None
+    step = chunk_size - overlap
     
-    for chunk in chunks:
-        chunk_text = chunk["text"]
+    for page in pages:
+        text = page["text"]
         
-        # Check if this chunk contains a section heading
-        found_section = None
-        for section in sections:
-            # Simple substring matching
-            if section in chunk_text[:400]:  # Check first 400 chars
-                found_section = section
-                current_section = section
-                break
+        # Sliding window of (start, end, section) word spans
+        window = deque()
+        ready = []
+        for line_match in _LINE_RE.finditer(text):
+            line = line_match.group().strip()
+            if is_section_heading(line):
+                # Clean up bullets and extra spaces
+                section = re.sub(r'^[•\-\*]\s*', '', line)
+                section = re.sub(r'\s+', ' ', section).strip()
+                
+                if section and len(section) > 3:
+                    sections.append(section)
+                    current_section = section
+                    print(f"  📌 Found section: {section}")
+            
+            for m in _WORD_RE.finditer(text, line_match.start(), line_match.end()):
+                window.append((m.start(), m.end(), current_section))
+                if len(window) == chunk_size:
+                    ready.append(_window_chunk(text, window, page["page"]))
+                    for _ in range(step):
+                        window.popleft()
         
-        if not found_section:
-            found_section = current_section
+        # Flush the tail like the stride loop did: one more window per
+        # remaining start offset, even if it only repeats the overlap
+        while window:
+            ready.append(_window_chunk(text, window, page["page"]))
+            for _ in range(min(step, len(window))):
+                window.popleft()
         
-        enriched.append({
-            "text": chunk["text"],
-            "meta": {
-                "page": chunk["page"],
-                "section": found_section
-            }
-        })
+        for chunk in ready:
+            if not sections:
+                pending.append(chunk)
+                continue
+            for held in pending:
+                held["meta"]["section"] = sections[0]
+                yield held
+            pending = []
+            if chunk["meta"]["section"] is None:
+                chunk["meta"]["section"] = sections[0]
+            yield chunk
     
-    return enriched
+    if pending:
+        print("⚠️ No sections found - using page numbers")
+    for held in pending:
+        held["meta"]["section"] = f"صفحة {held['meta']['page']}"
+        yield held
+
+
+def stream_chunks(header, enriched_chunks, sections):
+    """
+    Emit the response as NDJSON: one metadata line, one line per chunk as it
+    is produced, then a summary line with the totals and detected sections
+    (or, if chunking fails part-way, a final {"success": false, "error"} line).
+    Sync on purpose: Starlette runs it in a worker thread, keeping the
+    CPU-bound chunking off the event loop.
+    """
+    yield json.dumps(header, ensure_ascii=False) + "\n"
+    total_chunks = 0
+    try:
+        for chunk in enriched_chunks:
+            total_chunks += 1
+            yield json.dumps(chunk, ensure_ascii=False) + "\n"
+    except Exception as e:
+        # The 200 status is already sent, so report the failure in-band
+        print(f"❌ Chunking failed mid-stream: {e}")
+        yield json.dumps({
+            "success": False,
+            "error": str(e),
+            "total_chunks": total_chunks,
+        }, ensure_ascii=False) + "\n"
+        return
+    yield json.dumps({
+        "total_chunks": total_chunks,
+        "detected_sections": sections,
+        "sections_count": len(sections),
+    }, ensure_ascii=False) + "\n"
 
 
 @app.post("/ingest")
-async def ingest(file: UploadFile = File(...)):
+async def ingest(file: UploadFile = File(...), stream: bool = True, dpi: int = Query(200, ge=72, le=600)):
     """
     Ingest PDF with OCR for Arabic support.
     
+    Parameters:
+    - stream: Return NDJSON: a header line, one line per chunk, then a summary line
+      with totals and detected sections (use stream=false for a single JSON object)
+    - dpi: OCR rendering resolution, 72-600 (higher is slower but can help small print)
+    
     IMPORTANT: This endpoint requires OCR for proper Arabic text extraction.
-    Install: pip install pytesseract pdf2image pillow
+    Install: pip install pytesseract pymupdf pillow
     And: sudo apt-get install tesseract-ocr tesseract-ocr-ara
     """
-    content = await file.read()
-
-    if not hasattr(torch, "xpu"):
-        class FakeXPU:
-            @staticmethod
-            def is_available():
-                return False
-            @staticmethod
-            def device_count():
-                return 0
-        torch.xpu = FakeXPU()
-
+    # Stream the upload to disk instead of buffering it in memory
     with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(content)
+        while chunk := await file.read(1 << 20):
+            tmp.write(chunk)
         pdf_path = tmp.name
 
     try:
@@ -212,14 +448,14 @@ async def ingest(file: UploadFile = File(...)):
         print("STEP 1: Extracting text with OCR")
         print("="*60)
         
-        pages = extract_with_ocr(pdf_path)
+        pages = extract_with_ocr(pdf_path, dpi=dpi)
         
         if not pages:
             return {
                 "success": False,
                 "error": "OCR extraction failed. Please install pytesseract and tesseract-ocr with Arabic support.",
                 "install_instructions": {
-                    "python": "pip install pytesseract pdf2image pillow",
+                    "python": "pip install pytesseract pymupdf pillow",
                     "system": {
                         "ubuntu": "sudo apt-get install tesseract-ocr tesseract-ocr-ara",
                         "macos": "brew install tesseract tesseract-lang",
@@ -229,33 +465,32 @@ async def ingest(file: UploadFile = File(...)):
             }
         
         # ========================================
-        # STEP 2: Extract sections
-        # ========================================
-        print("\n" + "="*60)
-        print("STEP 2: Detecting sections")
-        print("="*60)
-        
-        sections = extract_sections_from_pages(pages)
-        print(f"\n✅ Found {len(sections)} sections")
-        
-        # ========================================
-        # STEP 3: Create chunks
+        # STEP 2: Detect sections and create chunks
         # ========================================
         print("\n" + "="*60)
-        print("STEP 3: Creating chunks")
+        print("STEP 2: Detecting sections and creating chunks")
         print("="*60)
         
-        chunks = chunk_text_pages(pages, chunk_size=600, overlap=100)
-        print(f"✅ Created {len(chunks)} chunks")
+        sections = []
+        enriched_chunks = iter_enriched_chunks(pages, sections, chunk_size=600, overlap=100)
         
-        # ========================================
-        # STEP 4: Assign sections to chunks
-        # ========================================
-        print("\n" + "="*60)
-        print("STEP 4: Assigning sections to chunks")
-        print("="*60)
+        if stream:
+            # Totals and sections are only known once chunking finishes, so
+            # they go in the trailing summary line
+            header = {
+                "success": True,
+                "total_pages": len(pages),
+                **extraction_summary(pages),
+            }
+            os.unlink(pdf_path)
+            return StreamingResponse(
+                stream_chunks(header, enriched_chunks, sections),
+                media_type="application/x-ndjson"
+            )
         
-        enriched_chunks = assign_sections_smart(chunks, sections)
+        enriched_chunks = list(enriched_chunks)
+        print(f"\n✅ Found {len(sections)} sections")
+        print(f"✅ Created {len(enriched_chunks)} chunks")
         
         # Show sample
         if enriched_chunks:
@@ -267,13 +502,12 @@ async def ingest(file: UploadFile = File(...)):
         
         return {
             "success": True,
-            "method": "ocr_tesseract",
             "total_pages": len(pages),
+            **extraction_summary(pages),
             "total_chunks": len(enriched_chunks),
             "detected_sections": sections,
             "sections_count": len(sections),
             "chunks": enriched_chunks,
-            "note": "Text extracted using OCR for proper Arabic support"
         }
 
     except Exception as e:
@@ -287,18 +521,28 @@ async def ingest(file: UploadFile = File(...)):
         }
 
 
+@functools.lru_cache(maxsize=1)
+def _probe_tesseract():
+    """
+    Query the Tesseract version and installed languages once per process.
+    Failures are not cached, so a missing install is re-checked next time.
+    """
+    import pytesseract
+    import fitz
+    
+    # Try to get tesseract version
+    version = pytesseract.get_tesseract_version()
+    
+    # Check for Arabic language
+    langs = pytesseract.get_languages()
+    return version, langs
+
+
 @app.get("/health")
 async def health():
     """Check if OCR is available"""
     try:
-        import pytesseract
-        from pdf2image import convert_from_path
-        
-        # Try to get tesseract version
-        version = pytesseract.get_tesseract_version()
-        
-        # Check for Arabic language
-        langs = pytesseract.get_languages()
+        version, langs = _probe_tesseract()
         has_arabic = 'ara' in langs
         
         return {
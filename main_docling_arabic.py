@@ -5,24 +5,120 @@ Supports Arabic (RTL), English, and French languages.
 """
 
 from fastapi import FastAPI, UploadFile, File
-import tempfile, os
-import torch
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import tempfile, os, glob
+import functools
 import re
-from typing import List, Dict, Any
-import subprocess
+from typing import List, Dict, Any, Tuple, Iterable, Iterator
+import json
+import shutil
+import traceback
+import asyncio
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+import threading
+import importlib.util
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 app = FastAPI()
 
+# Probed without importing it, so DOCX-only workers never pay for loading Docling
+_DOCLING_OK = importlib.util.find_spec("docling") is not None
+
+# Guards first-time DocumentConverter construction (see _get_converter)
+_CONVERTER_LOCK = threading.Lock()
+
+# Include tracebacks in error responses only when DEBUG=1
+_DEBUG = os.environ.get('DEBUG') == '1'
+
+# Pages OCR'd at once by the fallback extractor (one tesseract process each)
+OCR_CONCURRENCY = int(os.environ.get('OCR_CONCURRENCY', os.cpu_count() or 1))
+
+# Fallback OCR render resolution: scans are rendered at their own resolution
+# within [OCR_MIN_DPI, OCR_MAX_DPI]; pages without images use OCR_DEFAULT_DPI
+OCR_DEFAULT_DPI = 200
+OCR_MIN_DPI = 150
+OCR_MAX_DPI = 300
+
 
 # ========================================
 # Auto-configure TESSDATA_PREFIX
 # ========================================
+# Roots searched (up to TESSDATA_SEARCH_DEPTH levels down) when no well-known path matches
+_TESSDATA_SEARCH_ROOTS = ('/usr/share', '/usr/local/share', '/usr/lib', '/opt')
+TESSDATA_SEARCH_DEPTH = 4
+_TESSDATA_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'tessdata_prefix')
+
+
+def _has_traineddata(path: str) -> bool:
+    """True if the directory holds at least one .traineddata file (stops at the first hit)."""
+    # glob lists the whole directory before filtering; scandir lets us stop early
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.endswith('.traineddata'):
+                    return True
+    except OSError:
+        pass
+    return False
+
+
+def _use_tessdata(path: str, source: str):
+    """Export TESSDATA_PREFIX and report which languages are installed."""
+    os.environ['TESSDATA_PREFIX'] = path
+    print(f"✅ {source} TESSDATA_PREFIX: {path}")
+    
+    # Check for all supported languages
+    has_ara = os.path.isfile(os.path.join(path, 'ara.traineddata'))
+    has_eng = os.path.isfile(os.path.join(path, 'eng.traineddata'))
+    has_fra = os.path.isfile(os.path.join(path, 'fra.traineddata'))
+    print(f"  - Arabic support: {'✅' if has_ara else '❌'}")
+    print(f"  - English support: {'✅' if has_eng else '❌'}")
+    print(f"  - French support: {'✅' if has_fra else '❌'}")
+    
+    if not has_ara:
+        print(f"  ⚠️  Arabic not found. Install with:")
+        print(f"      sudo apt-get install tesseract-ocr-ara")
+    if not has_eng:
+        print(f"  ⚠️  English not found. Install with:")
+        print(f"      sudo apt-get install tesseract-ocr-eng")
+    if not has_fra:
+        print(f"  ⚠️  French not found. Install with:")
+        print(f"      sudo apt-get install tesseract-ocr-fra")
+
+
+def _iter_tessdata_dirs():
+    """Yield 'tessdata' directories under the search roots, shallowest first."""
+    for depth in range(TESSDATA_SEARCH_DEPTH):
+        for root in _TESSDATA_SEARCH_ROOTS:
+            pattern = os.path.join(root, *(['*'] * depth), 'tessdata')
+            for path in glob.iglob(pattern):
+                if os.path.isdir(path):
+                    yield path
+
+
+@functools.lru_cache(maxsize=None)
 def setup_tessdata_prefix():
     """Automatically detect and set TESSDATA_PREFIX if not set."""
     if os.environ.get('TESSDATA_PREFIX'):
         print(f"✅ TESSDATA_PREFIX already set: {os.environ['TESSDATA_PREFIX']}")
         return True
     
+    # Reuse the path resolved by a previous start
+    try:
+        with open(_TESSDATA_CACHE, encoding='utf-8') as f:
+            cached = f.read().strip()
+        if cached and os.path.isdir(cached) and _has_traineddata(cached):
+            _use_tessdata(cached, "Cached")
+            return True
+    except OSError:
+        pass
+    
     # Common tessdata locations
     possible_paths = [
         '/usr/share/tesseract-ocr/5/tessdata',
@@ -32,45 +128,21 @@ def setup_tessdata_prefix():
         '/usr/local/share/tessdata',
         'C:\\Program Files\\Tesseract-OCR\\tessdata',
     ]
+    found = next((p for p in possible_paths if os.path.isdir(p) and _has_traineddata(p)), None)
     
-    # Try to find tessdata using system command
-    try:
-        result = subprocess.run(['find', '/usr', '-name', 'tessdata', '-type', 'd'], 
-                              capture_output=True, text=True, timeout=5)
-        if result.stdout:
-            found_paths = result.stdout.strip().split('\n')
-            possible_paths = found_paths + possible_paths
-    except:
-        pass
+    # Only fall back to searching the filesystem when no well-known path matched
+    if found is None:
+        found = next((p for p in _iter_tessdata_dirs() if _has_traineddata(p)), None)
     
-    # Check each path
-    for path in possible_paths:
-        if os.path.exists(path) and os.path.isdir(path):
-            # Check if it contains language files
-            files = os.listdir(path)
-            if any(f.endswith('.traineddata') for f in files):
-                os.environ['TESSDATA_PREFIX'] = path
-                print(f"✅ Auto-detected TESSDATA_PREFIX: {path}")
-                
-                # Check for all supported languages
-                has_ara = 'ara.traineddata' in files
-                has_eng = 'eng.traineddata' in files
-                has_fra = 'fra.traineddata' in files
-                print(f"  - Arabic support: {'✅' if has_ara else '❌'}")
-                print(f"  - English support: {'✅' if has_eng else '❌'}")
-                print(f"  - French support: {'✅' if has_fra else '❌'}")
-                
-                if not has_ara:
-                    print(f"  ⚠️  Arabic not found. Install with:")
-                    print(f"      sudo apt-get install tesseract-ocr-ara")
-                if not has_eng:
-                    print(f"  ⚠️  English not found. Install with:")
-                    print(f"      sudo apt-get install tesseract-ocr-eng")
-                if not has_fra:
-                    print(f"  ⚠️  French not found. Install with:")
-                    print(f"      sudo apt-get install tesseract-ocr-fra")
-                
-                return True
+    if found is not None:
+        _use_tessdata(found, "Auto-detected")
+        try:
+            os.makedirs(os.path.dirname(_TESSDATA_CACHE), exist_ok=True)
+            with open(_TESSDATA_CACHE, 'w', encoding='utf-8') as f:
+                f.write(found)
+        except OSError:
+            pass
+        return True
     
     print("❌ Could not auto-detect TESSDATA_PREFIX")
     print("Please set it manually:")
@@ -82,6 +154,182 @@ def setup_tessdata_prefix():
 setup_tessdata_prefix()
 
 
+# ========================================
+# Optional backends, imported once on first use
+# ========================================
+def _torch_threads() -> int:
+    """Intra-op threads: all cores in the server, a fair share in page-batch workers."""
+    cpus = os.cpu_count() or 1
+    if multiprocessing.parent_process() is not None:
+        return max(1, cpus // PAGE_BATCH_WORKERS)
+    return cpus
+
+
+@functools.lru_cache(maxsize=None)
+def _get_torch():
+    """
+    Import torch configured for inference: no autograd, and fixed thread
+    counts so page-batch workers don't oversubscribe the CPU. Also stubs
+    torch.xpu, which Docling probes but older builds lack.
+    """
+    threads = _torch_threads()
+    # OpenMP reads this when torch loads, so it has to be set before the import
+    os.environ.setdefault('OMP_NUM_THREADS', str(threads))
+    
+    import torch
+    torch.set_grad_enabled(False)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed before any inter-op work has run in this process
+        pass
+    
+    if not hasattr(torch, "xpu"):
+        class FakeXPU:
+            @staticmethod
+            def is_available():
+                return False
+            @staticmethod
+            def device_count():
+                return 0
+        torch.xpu = FakeXPU()
+    return torch
+
+
+@functools.lru_cache(maxsize=None)
+def _get_pypdf2():
+    import PyPDF2
+    return PyPDF2
+
+
+@functools.lru_cache(maxsize=None)
+def _get_pdfium():
+    import pypdfium2
+    return pypdfium2
+
+
+@functools.lru_cache(maxsize=None)
+def _get_pytesseract():
+    import pytesseract
+    return pytesseract
+
+
+@functools.lru_cache(maxsize=None)
+def _get_docx_document():
+    from docx import Document
+    return Document
+
+
+@functools.lru_cache(maxsize=None)
+def _get_docling():
+    """(DocumentConverter, PdfFormatOption, InputFormat, PdfPipelineOptions, TesseractOcrOptions)"""
+    _get_torch()
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import (
+        PdfPipelineOptions,
+        TesseractOcrOptions,
+    )
+    return DocumentConverter, PdfFormatOption, InputFormat, PdfPipelineOptions, TesseractOcrOptions
+
+
+# Multilingual tokenizer for chunk budgets: splits Arabic into real subwords
+# where bert-base-uncased emits [UNK]s, so a 600-token chunk holds more text
+CHUNK_TOKENIZER = os.environ.get('CHUNK_TOKENIZER', 'xlm-roberta-base')
+
+
+@functools.lru_cache(maxsize=2)
+def _get_chunker(max_tokens: int, overlap_tokens: int, heading_hierarchies: bool):
+    """HybridChunker (and its tokenizer) built once per settings and reused."""
+    _get_torch()
+    from docling.chunking import HybridChunker
+    from docling_core.transforms.chunker.tokenizer.huggingface import HuggingFaceTokenizer
+    from transformers import AutoTokenizer
+    
+    # Explicit Rust-backed tokenizer instead of the deprecated model-name string
+    tokenizer = HuggingFaceTokenizer(
+        tokenizer=AutoTokenizer.from_pretrained(CHUNK_TOKENIZER, use_fast=True),
+        max_tokens=max_tokens,
+    )
+    return HybridChunker(
+        tokenizer=tokenizer,
+        overlap_tokens=overlap_tokens,
+        heading_hierarchies=heading_hierarchies,
+    )
+
+
+# ========================================
+# Precompiled patterns
+# ========================================
+_NUMBERED_RE = re.compile(r'^(\d+|[٠-٩]+)[\.\-\:]\s*.+')
+_ROMAN_RE = re.compile(r'^[IVX]+[\.\-\:]\s*.+', re.IGNORECASE)
+_WS_RE = re.compile(r'\s+')
+_PARA_SPLIT_RE = re.compile(r'\s{2,}|\.\s+(?=[A-Za-z\u0600-\u06FF])')
+_SECTION_SPLIT_RE = re.compile(r'[:\-]\s+')
+
+# One-pass orthographic folding: Alef variants -> ا, ة -> ه, ى -> ي,
+# and tashkeel (U+064B-U+065F) plus tatweel (U+0640) dropped
+_ARABIC_NORM = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه', 'ى': 'ي', '\u0640': None,
+    **{chr(c): None for c in range(0x064B, 0x0660)},
+})
+
+
+def _normalize_arabic(text: str) -> str:
+    """NFKC-fold presentation forms, then collapse letter variants and strip tashkeel."""
+    return unicodedata.normalize('NFKC', text).translate(_ARABIC_NORM)
+
+
+# ========================================
+# Section keyword indicators
+# ========================================
+# Arabic section keywords
+_ARABIC_INDICATORS = [
+    'الوحدة', 'وحدة', 'الفصل', 'فصل',
+    'المقدمة', 'مقدمة', 'الخاتمة', 'خاتمة',
+    'الأهداف', 'أهداف', 'المنهجية', 'منهجية',
+    'التقويم', 'تقويم', 'الباب', 'باب',
+    'القسم', 'قسم', 'الجزء', 'جزء',
+    'الفرع', 'فرع', 'الملحق', 'ملحق',
+    'المراجع', 'مراجع', 'فترة المراجعة',
+]
+
+# English section keywords
+_ENGLISH_INDICATORS = [
+    'chapter', 'section', 'unit', 'introduction', 'conclusion',
+    'abstract', 'summary', 'appendix', 'references', 'bibliography',
+    'part', 'volume', 'preface', 'foreword', 'acknowledgments',
+    'table of contents', 'index', 'glossary'
+]
+
+# French section keywords
+_FRENCH_INDICATORS = [
+    'chapitre', 'section', 'unité', 'introduction', 'conclusion',
+    'résumé', 'annexe', 'références', 'bibliographie',
+    'partie', 'volume', 'préface', 'avant-propos', 'remerciements',
+    'table des matières', 'index', 'glossaire', 'objectifs',
+    'méthodologie', 'évaluation'
+]
+
+# Lowered and de-duplicated once; matched in a single pass per line.
+# Arabic has no case, so only the Latin-script keywords need lowering
+_SECTION_INDICATORS = tuple(dict.fromkeys(
+    _ARABIC_INDICATORS + [i.lower() for i in _ENGLISH_INDICATORS + _FRENCH_INDICATORS]
+))
+
+if ahocorasick is not None:
+    _INDICATORS_AC = ahocorasick.Automaton()
+    for _indicator in _SECTION_INDICATORS:
+        _INDICATORS_AC.add_word(_indicator, _indicator)
+    _INDICATORS_AC.make_automaton()
+    _INDICATORS_RE = None
+else:
+    _INDICATORS_AC = None
+    _INDICATORS_RE = re.compile('|'.join(map(re.escape, _SECTION_INDICATORS)))
+
+
 def is_section_heading(text: str) -> bool:
     """Robust section heading detection for Arabic, English, and French text."""
     text = text.strip()
@@ -89,48 +337,25 @@ def is_section_heading(text: str) -> bool:
     if not text or len(text) > 200 or len(text) < 3:
         return False
     
-    # Arabic section keywords
-    arabic_indicators = [
-        'الوحدة', 'وحدة', 'الفصل', 'فصل',
-        'المقدمة', 'مقدمة', 'الخاتمة', 'خاتمة',
-        'الأهداف', 'أهداف', 'المنهجية', 'منهجية',
-        'التقويم', 'تقويم', 'الباب', 'باب',
-        'القسم', 'قسم', 'الجزء', 'جزء',
-        'الفرع', 'فرع', 'الملحق', 'ملحق',
-        'المراجع', 'مراجع', 'فترة المراجعة',
-    ]
-    
-    # English section keywords
-    english_indicators = [
-        'chapter', 'section', 'unit', 'introduction', 'conclusion',
-        'abstract', 'summary', 'appendix', 'references', 'bibliography',
-        'part', 'volume', 'preface', 'foreword', 'acknowledgments',
-        'table of contents', 'index', 'glossary'
-    ]
-    
-    # French section keywords
-    french_indicators = [
-        'chapitre', 'section', 'unité', 'introduction', 'conclusion',
-        'résumé', 'annexe', 'références', 'bibliographie',
-        'partie', 'volume', 'préface', 'avant-propos', 'remerciements',
-        'table des matières', 'index', 'glossaire', 'objectifs',
-        'méthodologie', 'évaluation'
-    ]
-    
-    # Combine all indicators
-    section_indicators = arabic_indicators + english_indicators + french_indicators
-    
+    return _is_section_heading_cached(text)
+
+
+@functools.lru_cache(maxsize=8192)
+def _is_section_heading_cached(text: str) -> bool:
+    """Keyword and pattern checks for a stripped, length-gated line (memoized)."""
     text_lower = text.lower()
-    for indicator in section_indicators:
-        if indicator.lower() in text_lower:
+    if _INDICATORS_AC is not None:
+        for _ in _INDICATORS_AC.iter(text_lower):
             return True
+    elif _INDICATORS_RE.search(text_lower):
+        return True
     
     # Numbered sections (supports Arabic, English, and French numbering)
-    if re.match(r'^(\d+|[٠-٩]+)[\.\-\:]\s*.+', text):
+    if _NUMBERED_RE.match(text):
         return True
     
     # Roman numerals (common in French/English documents)
-    if re.match(r'^[IVX]+[\.\-\:]\s*.+', text, re.IGNORECASE):
+    if _ROMAN_RE.match(text):
         return True
     
     # Short lines with colons (common pattern for headings)
@@ -144,93 +369,148 @@ def is_section_heading(text: str) -> bool:
     return False
 
 
+# Docling item labels that mark headings, and body labels worth a pattern check
+_HEADING_LABELS = frozenset({'title', 'section_header', 'heading'})
+_BODY_LABELS = frozenset({'text', 'paragraph'})
+
+
 def extract_sections_from_docling_document(doc) -> List[str]:
-    """Extract section headings from Docling document using its structure."""
-    sections = []
+    """
+    Extract section headings from Docling document using its structure.
+    One pass over the items: labelled headings always count; short body
+    lines that look like headings are only used when the structure gives
+    fewer than 3 sections.
+    """
+    found = []  # (from_structure, text) in document order
+    structural = 0
     
     try:
-        # Method 1: Extract from document structure
-        for item in doc.iterate_items():
-            if hasattr(item, 'label'):
-                label = str(item.label).lower()
-                if any(x in label for x in ['heading', 'title', 'section']):
-                    if hasattr(item, 'text'):
-                        section_text = item.text.strip()
-                        if section_text and len(section_text) > 3:
-                            sections.append(section_text)
-                            print(f"  📌 Structure: {section_text[:80]}")
-        
-        # Method 2: Parse markdown export for headings
-        if not sections or len(sections) < 3:
-            markdown = doc.export_to_markdown()
-            lines = markdown.split('\n')
-            
-            for line in lines:
-                # Markdown headings start with #
-                if line.startswith('#'):
-                    heading = re.sub(r'^#+\s*', '', line).strip()
-                    if heading and len(heading) > 3:
-                        sections.append(heading)
-                        print(f"  📌 Markdown: {heading[:80]}")
-                # Text-based headings
-                elif is_section_heading(line):
-                    sections.append(line.strip())
-                    print(f"  📌 Pattern: {line[:80]}")
+        for item, _level in doc.iterate_items():
+            label = getattr(item, 'label', None)
+            text = getattr(item, 'text', None)
+            if label is None or not text:
+                continue
+            label = str(getattr(label, 'value', label)).lower()
+            text = text.strip()
+            
+            if label in _HEADING_LABELS:
+                if len(text) > 3:
+                    found.append((True, text))
+                    structural += 1
+            elif label in _BODY_LABELS and len(text) < 200 and is_section_heading(text):
+                found.append((False, text))
     
     except Exception as e:
         print(f"⚠️ Error extracting sections: {e}")
     
+    sections = []
+    for from_structure, text in found:
+        if from_structure:
+            sections.append(text)
+            print(f"  📌 Structure: {text[:80]}")
+        elif structural < 3:
+            sections.append(text)
+            print(f"  📌 Pattern: {text[:80]}")
+    
     return sections
 
 
-def assign_sections_to_chunks(chunks: List[Dict], sections: List[str]) -> List[Dict]:
-    """Intelligently assign section names to chunks."""
-    if not sections:
-        print("⚠️ No sections detected - using page numbers")
-        return [{
-            "text": c["text"],
-            "meta": {
-                "page": c.get("page"),
-                "section": f"صفحة {c.get('page', 'غير محدد')}"
-            }
-        } for c in chunks]
+def _page_section(page) -> str:
+    """Section label used when no headings were detected."""
+    return f"صفحة {page}"
+
+
+def _make_section_matcher(sections: List[str]):
+    """
+    Return match(text) -> section for consecutive chunk texts.
+    A chunk whose first 500 chars contain a section heading gets that section;
+    otherwise it inherits the last section seen.
+    """
+    # Normalize every section once; the normalized test also covers the raw one
+    normalized_sections = [_normalize_arabic(s) for s in sections]
     
-    enriched = []
-    current_section = sections[0]
+    # One automaton over all sections; values keep list order so the
+    # earliest listed section still wins when several match
+    automaton = None
+    if ahocorasick is not None and all(normalized_sections):
+        automaton = ahocorasick.Automaton()
+        for idx, normalized in enumerate(normalized_sections):
+            if normalized not in automaton:
+                automaton.add_word(normalized, (idx, sections[idx]))
+        automaton.make_automaton()
     
-    print(f"\n📊 Assigning {len(sections)} sections to {len(chunks)} chunks...")
+    state = {"current": sections[0], "idx": 0}
     
-    for idx, chunk in enumerate(chunks):
-        chunk_text = chunk["text"]
+    def match(chunk_text: str) -> str:
+        idx = state["idx"]
+        state["idx"] = idx + 1
         found_section = None
         
         # Check if chunk contains section heading (first 500 chars)
-        search_text = chunk_text[:500]
-        
-        for section in sections:
-            # Normalize for comparison
-            section_normalized = re.sub(r'[ًٌٍَُِّْ]', '', section)
-            search_normalized = re.sub(r'[ًٌٍَُِّْ]', '', search_text)
-            
-            if section_normalized in search_normalized or section in search_text:
-                found_section = section
-                current_section = section
-                if idx < 3:
-                    print(f"  ✅ Chunk {idx}: {section[:60]}...")
-                break
+        search_normalized = _normalize_arabic(chunk_text[:500])
         
-        if not found_section:
-            found_section = current_section
+        if automaton is not None:
+            hits = [value for _, value in automaton.iter(search_normalized)]
+            if hits:
+                found_section = min(hits)[1]
+        else:
+            for section, section_normalized in zip(sections, normalized_sections):
+                if section_normalized in search_normalized:
+                    found_section = section
+                    break
         
-        enriched.append({
-            "text": chunk["text"],
+        if found_section:
+            state["current"] = found_section
+            if idx < 3:
+                print(f"  ✅ Chunk {idx}: {found_section[:60]}...")
+            return found_section
+        return state["current"]
+    
+    return match
+
+
+def iter_sections_to_chunks(chunks: Iterable[Dict], sections: List[str]) -> Iterator[Dict]:
+    """
+    Yield chunks enriched with their section one at a time.
+    `chunks` may be any iterable, so a chunker generator streams straight through.
+    """
+    match = _make_section_matcher(sections) if sections else None
+    for c in chunks:
+        page = c.get("page")
+        yield {
+            "text": c["text"],
             "meta": {
-                "page": chunk.get("page"),
-                "section": found_section
+                "page": page,
+                "section": match(c["text"]) if match else _page_section(page if 'page' in c else 'غير محدد')
             }
-        })
+        }
+
+
+def assign_sections_to_chunks(chunks: List[Dict], sections: List[str]) -> Tuple[List[Dict], set]:
+    """
+    Intelligently assign section names to chunks.
+    Returns the enriched chunks and the set of sections they were given.
+    """
+    # Work on parallel lists and only build the nested dicts once at the end
+    texts = [c["text"] for c in chunks]
+    pages = [c.get("page") for c in chunks]
+    
+    if not sections:
+        print("⚠️ No sections detected - using page numbers")
+        chunk_sections = [
+            _page_section(page if 'page' in c else 'غير محدد')
+            for c, page in zip(chunks, pages)
+        ]
+    else:
+        print(f"\n📊 Assigning {len(sections)} sections to {len(chunks)} chunks...")
+        match = _make_section_matcher(sections)
+        chunk_sections = [match(text) for text in texts]
     
-    return enriched
+    enriched = [
+        {"text": text, "meta": {"page": page, "section": section}}
+        for text, page, section in zip(texts, pages, chunk_sections)
+    ]
+    return enriched, set(chunk_sections)
 
 
 def clean_text(text: str) -> str:
@@ -240,31 +520,48 @@ def clean_text(text: str) -> str:
     if not text:
         return ""
     
-    # Replace all newlines with spaces
-    text = text.replace('\n', ' ')
-    
-    # Replace multiple spaces with single space
-    import re
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Remove leading/trailing spaces
-    text = text.strip()
+    # One pass: \s+ already covers newlines, tabs and runs of spaces
+    return _WS_RE.sub(' ', text).strip()
+
+
+def _ocr_render_scale(page, pdfium) -> float:
+    """
+    Render scale for OCR'ing one pdfium page, from the resolution of its
+    largest embedded image. Rendering a scan above its own resolution only
+    adds pixels for Tesseract to chew through.
+    """
+    native_dpi = None
+    largest = 0
+    for obj in page.get_objects(filter=(pdfium.raw.FPDF_PAGEOBJ_IMAGE,), max_depth=1):
+        px_w, px_h = obj.get_size()
+        left, _, right, _ = obj.get_pos()
+        if right - left > 0 and px_w * px_h > largest:
+            largest = px_w * px_h
+            native_dpi = px_w * 72 / (right - left)
     
-    return text
+    if native_dpi is None:
+        return OCR_DEFAULT_DPI / 72
+    return min(max(native_dpi, OCR_MIN_DPI), OCR_MAX_DPI) / 72
 
 
 async def _process_with_alternative_method(pdf_path: str):
     """
     Alternative PDF processing method when Docling fails.
+    Runs the blocking extraction in a worker thread.
+    """
+    return await asyncio.to_thread(_run_alternative_method, pdf_path)
+
+
+def _run_alternative_method(pdf_path: str, allow_ocr: bool = True):
+    """
     Uses PyPDF2/pdfplumber for text extraction and Tesseract directly for OCR.
     Supports Arabic, English, and French.
+    With allow_ocr=False only the native text layer is read.
     """
     print("  📄 Using alternative PDF processing method (multilingual support)...")
     
     try:
-        import PyPDF2
-        from pdf2image import convert_from_path
-        import pytesseract
+        PyPDF2 = _get_pypdf2()
         
         # Try to extract text directly from PDF first
         text_chunks = []
@@ -284,27 +581,25 @@ async def _process_with_alternative_method(pdf_path: str):
                     # Clean the text first
                     text = clean_text(text)
                     
-                    # Simple chunking by paragraphs (split by double spaces or periods)
-                    # Split by common paragraph markers
-                    import re
-                    # Split by multiple spaces, periods followed by space, or numbered items
-                    paragraphs = re.split(r'\s{2,}|\.\s+(?=[A-Za-z\u0600-\u06FF])', text)
-                    
-                    for para in paragraphs:
-                        para = para.strip()
-                        # Clean the paragraph
-                        para = clean_text(para)
-                        if len(para) > 30:  # Only keep substantial paragraphs
-                            text_chunks.append({
-                                "text": para,
-                                "page": page_num + 1
-                            })
+                    # Simple chunking by paragraphs (split by double spaces or periods);
+                    # a page this short cannot hold a substantial paragraph
+                    if len(text) > 30:
+                        for para in _PARA_SPLIT_RE.split(text):
+                            # Cleaning never lengthens text, so drop short pieces first
+                            if len(para) <= 30:
+                                continue
+                            para = clean_text(para)
+                            if len(para) > 30:  # Only keep substantial paragraphs
+                                text_chunks.append({
+                                    "text": para,
+                                    "page": page_num + 1
+                                })
                     
                     # Try to detect sections (check cleaned text)
                     # Look for section indicators in the first part of the text
                     first_part = text[:500] if len(text) > 500 else text
                     # Split by common section markers
-                    potential_sections = re.split(r'[:\-]\s+', first_part)
+                    potential_sections = _SECTION_SPLIT_RE.split(first_part)
                     for potential in potential_sections[:5]:  # Check first 5 potential sections
                         potential = potential.strip()
                         if is_section_heading(potential):
@@ -312,17 +607,36 @@ async def _process_with_alternative_method(pdf_path: str):
                             break
         
         # If no text extracted, try OCR
-        if not text_chunks:
+        if not text_chunks and allow_ocr:
             print("  🔍 No text found, attempting OCR...")
             try:
-                images = convert_from_path(pdf_path, dpi=200)
-                for i, image in enumerate(images):
+                pdfium = _get_pdfium()
+                pytesseract = _get_pytesseract()
+                
+                # Each pytesseract call runs its own tesseract process, so
+                # threads are enough to keep every core busy
+                def _ocr(image):
                     # Use Tesseract directly with Arabic
-                    ocr_text = pytesseract.image_to_string(
+                    return pytesseract.image_to_string(
                         image, 
                         lang='ara+eng+fra',
                         config='--psm 6'
                     )
+                
+                # pdfium is not thread-safe: render pages here one at a time and
+                # hand each to the pool straight away so OCR overlaps rendering
+                pdf = pdfium.PdfDocument(pdf_path)
+                try:
+                    with ThreadPoolExecutor(max_workers=OCR_CONCURRENCY) as ex:
+                        futures = [
+                            ex.submit(_ocr, page.render(scale=_ocr_render_scale(page, pdfium)).to_pil())
+                            for page in pdf
+                        ]
+                        ocr_texts = [f.result() for f in futures]
+                finally:
+                    pdf.close()
+                
+                for i, ocr_text in enumerate(ocr_texts):
                     if ocr_text and ocr_text.strip():
                         # Clean the OCR text
                         cleaned_text = clean_text(ocr_text)
@@ -346,15 +660,16 @@ async def _process_with_alternative_method(pdf_path: str):
             }
         
         # Assign sections to chunks
-        enriched_chunks = assign_sections_to_chunks(text_chunks, sections)
+        enriched_chunks, unique_sections = assign_sections_to_chunks(text_chunks, sections)
         
         return {
             "success": True,
             "method": "alternative_pdf_processing",
+            "total_pages": num_pages,
             "total_chunks": len(enriched_chunks),
             "detected_sections": sections,
             "sections_count": len(sections),
-            "unique_sections_in_chunks": len(set(c['meta']['section'] for c in enriched_chunks)),
+            "unique_sections_in_chunks": len(unique_sections),
             "chunks": enriched_chunks,
             "metadata": {
                 "processing_method": "alternative",
@@ -366,8 +681,8 @@ async def _process_with_alternative_method(pdf_path: str):
         return {
             "success": False,
             "error": "Alternative processing method not available",
-            "details": "Required libraries (PyPDF2, pdf2image) not installed",
-            "install": "pip install PyPDF2 pdf2image pillow"
+            "details": "Required library (PyPDF2) not installed",
+            "install": "pip install PyPDF2 pypdfium2 pytesseract"
         }
     except Exception as e:
         return {
@@ -386,7 +701,7 @@ async def _process_docx_file(docx_path: str):
     print("="*70)
     
     try:
-        from docx import Document
+        Document = _get_docx_document()
         
         print("\n📄 STEP 1: Reading DOCX file...")
         doc = Document(docx_path)
@@ -395,51 +710,52 @@ async def _process_docx_file(docx_path: str):
         text_chunks = []
         sections = []
         current_page = 1
-        current_text = ""
+        # Paragraphs are cleaned once on the way in, so the buffer is joined
+        # as-is at flush time; buf_len tracks the joined length
+        buf = []
+        buf_len = 0
         
         print(f"  📝 Found {len(doc.paragraphs)} paragraphs")
         
         for para_idx, paragraph in enumerate(doc.paragraphs):
-            text = paragraph.text.strip()
+            # Clean the text
+            cleaned_text = clean_text(paragraph.text)
             
-            if not text:
+            if not cleaned_text:
                 continue
             
-            # Clean the text
-            cleaned_text = clean_text(text)
-            
             # Check if it's a section heading
             if is_section_heading(cleaned_text):
                 # Save previous chunk if exists
-                if current_text and len(current_text) > 30:
+                if buf_len > 30:
                     text_chunks.append({
-                        "text": clean_text(current_text),
+                        "text": ' '.join(buf),
                         "page": current_page
                     })
-                    current_text = ""
+                    buf = []
+                    buf_len = 0
                 
                 sections.append(cleaned_text)
                 print(f"  📌 Section detected: {cleaned_text[:60]}...")
             else:
                 # Add to current text chunk
-                if current_text:
-                    current_text += " " + cleaned_text
-                else:
-                    current_text = cleaned_text
+                buf_len += len(cleaned_text) + (1 if buf else 0)
+                buf.append(cleaned_text)
                 
                 # Create chunk if text is long enough
-                if len(current_text) > 600:
+                if buf_len > 600:
                     text_chunks.append({
-                        "text": clean_text(current_text),
+                        "text": ' '.join(buf),
                         "page": current_page
                     })
-                    current_text = ""
+                    buf = []
+                    buf_len = 0
                     current_page += 1
         
         # Add remaining text
-        if current_text and len(current_text) > 30:
+        if buf_len > 30:
             text_chunks.append({
-                "text": clean_text(current_text),
+                "text": ' '.join(buf),
                 "page": current_page
             })
         
@@ -447,7 +763,7 @@ async def _process_docx_file(docx_path: str):
         print(f"  ✅ Found {len(sections)} sections")
         
         # Assign sections to chunks
-        enriched_chunks = assign_sections_to_chunks(text_chunks, sections)
+        enriched_chunks, unique_sections = assign_sections_to_chunks(text_chunks, sections)
         
         return {
             "success": True,
@@ -455,7 +771,7 @@ async def _process_docx_file(docx_path: str):
             "total_chunks": len(enriched_chunks),
             "detected_sections": sections,
             "sections_count": len(sections),
-            "unique_sections_in_chunks": len(set(c['meta']['section'] for c in enriched_chunks)),
+            "unique_sections_in_chunks": len(unique_sections),
             "chunks": enriched_chunks,
             "metadata": {
                 "processing_method": "docx",
@@ -473,17 +789,333 @@ async def _process_docx_file(docx_path: str):
             "install": "pip install python-docx"
         }
     except Exception as e:
-        import traceback
-        return {
+        error = {
             "success": False,
             "error": "DOCX processing failed",
             "details": str(e),
-            "traceback": traceback.format_exc()
         }
+        if _DEBUG:
+            error["traceback"] = traceback.format_exc()
+        return error
 
 
-@app.post("/ingest")
-async def ingest(file: UploadFile = File(...)):
+# ========================================
+# Docling converters (built once, reused across requests)
+# ========================================
+# Directory of prefetched (or optimized) Docling model weights; None = download/HF cache
+DOCLING_ARTIFACTS_PATH = os.environ.get('DOCLING_ARTIFACTS_PATH') or None
+
+# Average characters per page the fast (no-OCR) tier must extract to be kept
+MIN_TEXT_CHARS_PER_PAGE = 200
+
+# PDFs with at least this many pages are OCR-converted in parallel page batches
+PAGE_BATCH_MIN_PAGES = 40
+PAGE_BATCH_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+
+
+def _build_pipeline_options(kind: str):
+    """Pipeline options for one converter kind, pointed at local model artifacts if configured."""
+    options = _pipeline_options_for(kind)
+    if DOCLING_ARTIFACTS_PATH:
+        options.artifacts_path = DOCLING_ARTIFACTS_PATH
+    return options
+
+
+def _pipeline_options_for(kind: str):
+    """Pipeline options for the fast, primary, OCR-only fallback and ultra-minimal attempts."""
+    _, _, _, PdfPipelineOptions, TesseractOcrOptions = _get_docling()
+    
+    if kind == "fast":
+        # Text layer only: no OCR, no table model, page images at native scale
+        return PdfPipelineOptions(
+            do_ocr=False,
+            do_table_structure=False,
+            images_scale=1.0,
+            generate_picture_images=False
+        )
+    
+    if kind == "fallback":
+        # Create minimal OCR-only pipeline
+        return PdfPipelineOptions(
+            do_ocr=True,
+            ocr_options=TesseractOcrOptions(
+                lang=["ara", "eng", "fra"],
+                force_full_page_ocr=True,
+                psm=6
+            ),
+            do_table_structure=False,  # CRITICAL: Disable table detection
+            images_scale=1.5  # Lower scale to reduce memory usage
+        )
+    
+    if kind == "ultra_minimal":
+        # Smallest configuration: auto PSM, no forced OCR, minimum image scale
+        return PdfPipelineOptions(
+            do_ocr=True,
+            ocr_options=TesseractOcrOptions(
+                lang=["ara", "eng", "fra"],
+                force_full_page_ocr=False,  # Try without force_full_page
+                psm=3  # Auto PSM mode
+            ),
+            do_table_structure=False,
+            images_scale=1.0  # Minimum scale
+        )
+    
+    # Try to import table structure options (may not be available in all versions)
+    try:
+        from docling.datamodel.pipeline_options import (
+            TableStructureOptions,
+            TableFormerMode,
+        )
+        HAS_TABLE_OPTIONS = True
+    except ImportError:
+        HAS_TABLE_OPTIONS = False
+        print("  ⚠️  TableStructureOptions not available, using default table settings")
+    
+    # Create pipeline options for PDF with optimal settings for Arabic
+    # Configure table structure options for better Arabic table extraction (if available)
+    table_structure_options = None
+    if HAS_TABLE_OPTIONS:
+        try:
+            table_structure_options = TableStructureOptions(
+                # Use accurate mode for better table structure recognition
+                mode=TableFormerMode.ACCURATE,
+                # Enable cell matching for better table cell extraction
+                do_cell_matching=True
+            )
+        except Exception as e:
+            print(f"  ⚠️  Could not create TableStructureOptions: {e}")
+            table_structure_options = None
+    
+    # Build pipeline options dictionary
+    # IMPORTANT: Use force_backend_text to prefer native PDF text over OCR
+    # This avoids tensor padding errors that occur with OCR processing
+    # We'll fallback to OCR if native text extraction fails
+    pipeline_kwargs = {
+        # Try to use native PDF text first (avoids tensor issues)
+        "force_backend_text": True,
+        # Enable OCR as fallback (critical for Arabic documents)
+        "do_ocr": True,
+        # Configure Tesseract for Arabic + English
+        "ocr_options": TesseractOcrOptions(
+            lang=["ara", "eng", "fra"],  # Arabic + English + French for multilingual documents
+            # Don't force full page OCR initially (may cause tensor issues)
+            force_full_page_ocr=False,
+            # PSM mode 3: Auto page segmentation (more flexible)
+            psm=3
+        ),
+        # DISABLE table structure detection to avoid tensor errors
+        "do_table_structure": False,
+        # Set lower images scale to reduce memory and tensor issues
+        "images_scale": 1.5,
+        # Disable picture generation to reduce processing
+        "generate_picture_images": False
+    }
+    
+    # Try to add batch sizes if available (may not exist in all versions)
+    # These help process pages one at a time
+    try:
+        # Test if these parameters exist by checking PdfPipelineOptions
+        test_options = PdfPipelineOptions()
+        if hasattr(test_options, 'layout_batch_size'):
+            pipeline_kwargs["layout_batch_size"] = 1
+        if hasattr(test_options, 'ocr_batch_size'):
+            pipeline_kwargs["ocr_batch_size"] = 1
+        if hasattr(test_options, 'table_batch_size'):
+            pipeline_kwargs["table_batch_size"] = 1
+    except:
+        pass
+    
+    # Add table structure options only if available
+    if table_structure_options is not None:
+        pipeline_kwargs["table_structure_options"] = table_structure_options
+    
+    return PdfPipelineOptions(**pipeline_kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def _build_converter(kind: str):
+    """DocumentConverter for one pipeline kind, built once; call it through _get_converter."""
+    DocumentConverter, PdfFormatOption, InputFormat, _, _ = _get_docling()
+    
+    return DocumentConverter(
+        format_options={
+            InputFormat.PDF: PdfFormatOption(pipeline_options=_build_pipeline_options(kind)),
+        }
+    )
+
+
+def _get_converter(kind: str):
+    """
+    Cached converter for `kind`. The first call can come from several
+    asyncio.to_thread workers at once, and lru_cache alone would let each of
+    them build its own converter, so construction is serialized.
+    """
+    with _CONVERTER_LOCK:
+        return _build_converter(kind)
+
+
+def _convert_fast(pdf_path: str):
+    """
+    Convert with the text-layer-only pipeline.
+    Returns None when it fails or averages under MIN_TEXT_CHARS_PER_PAGE,
+    so the caller moves on to the OCR tier.
+    """
+    try:
+        result = _get_converter("fast").convert(pdf_path)
+    except Exception as e:
+        print(f"  ⚠️  Fast tier failed: {str(e)[:200]}")
+        return None
+    
+    doc = result.document if result else None
+    if doc is None:
+        return None
+    
+    num_pages = len(doc.pages) or 1
+    if len(doc.export_to_text().strip()) < MIN_TEXT_CHARS_PER_PAGE * num_pages:
+        return None
+    return result
+
+
+def _has_usable_text_layer(alt_result: Dict) -> bool:
+    """
+    True when a native-only alternative result averages at least
+    MIN_TEXT_CHARS_PER_PAGE, the same bar the fast tier uses.
+    """
+    if not alt_result.get("success"):
+        return False
+    native_chars = sum(len(c["text"]) for c in alt_result["chunks"])
+    return native_chars >= MIN_TEXT_CHARS_PER_PAGE * (alt_result["total_pages"] or 1)
+
+
+def _convert_range(batch_path: str) -> dict:
+    """Worker-process entry point: convert one page batch with the primary pipeline."""
+    return _get_converter("primary").convert(batch_path).document.export_to_dict()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_page_pool():
+    """
+    Long-lived pool for page batches so workers keep their converter warm.
+    Spawned, not forked: the parent may already hold torch thread pools.
+    """
+    return ProcessPoolExecutor(
+        max_workers=PAGE_BATCH_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def _convert_in_page_batches(pdf_path: str):
+    """
+    Split a long PDF into page ranges and convert them in worker processes.
+    Returns the batches merged back into one document (pages renumbered in
+    order), or None when the PDF is too short to be worth splitting.
+    """
+    if PAGE_BATCH_WORKERS < 2:
+        return None
+    
+    pdfium = _get_pdfium()
+    src = pdfium.PdfDocument(pdf_path)
+    batch_paths = []
+    try:
+        total_pages = len(src)
+        if total_pages < PAGE_BATCH_MIN_PAGES:
+            return None
+        
+        batch_size = -(-total_pages // PAGE_BATCH_WORKERS)
+        for start in range(0, total_pages, batch_size):
+            stop = min(start + batch_size, total_pages)
+            part = pdfium.PdfDocument.new()
+            part.import_pages(src, list(range(start, stop)))
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+                part.save(tmp)
+                batch_paths.append(tmp.name)
+            part.close()
+    finally:
+        src.close()
+    
+    print(f"  🧩 Converting {total_pages} pages as {len(batch_paths)} parallel batches...")
+    try:
+        docs = list(_get_page_pool().map(_convert_range, batch_paths))
+    finally:
+        for path in batch_paths:
+            os.unlink(path)
+    
+    # One document, so chunking and section detection see the whole PDF and
+    # no chunk boundary is forced at a batch seam
+    from docling_core.types.doc import DoclingDocument
+    return DoclingDocument.concatenate([DoclingDocument.model_validate(d) for d in docs])
+
+
+def _iter_docling_chunks(doc, chunker) -> Iterator[Dict]:
+    """Chunk the document lazily, cleaning text as it goes."""
+    for dc in chunker.chunk(doc):
+        # Clean the text to remove unnecessary newlines
+        yield {
+            "text": clean_text(dc.text),
+            "page": dc.meta.get("page"),
+            "docling_section": dc.meta.get("headings", [None])[0] if dc.meta.get("headings") else None
+        }
+
+
+def stream_chunks(header, enriched_chunks):
+    """
+    Emit the response as NDJSON: one metadata line, one line per chunk as it
+    is produced, then a summary line with the totals (or, if chunking fails
+    part-way, a final {"success": false, "error"} line).
+    Sync on purpose: Starlette runs it in a worker thread, keeping the
+    CPU-bound chunking off the event loop.
+    """
+    yield json.dumps(header, ensure_ascii=False) + "\n"
+    total_chunks = 0
+    unique_sections = set()
+    try:
+        for chunk in enriched_chunks:
+            total_chunks += 1
+            unique_sections.add(chunk["meta"]["section"])
+            yield json.dumps(chunk, ensure_ascii=False) + "\n"
+    except Exception as e:
+        # The chunker/tokenizer runs lazily here, after the 200 status went out,
+        # so the failure can only be reported in-band as the last line
+        error = {
+            "success": False,
+            "error": str(e),
+            "total_chunks": total_chunks,
+        }
+        if _DEBUG:
+            error["traceback"] = traceback.format_exc()
+        yield json.dumps(error, ensure_ascii=False) + "\n"
+        return
+    yield json.dumps({
+        "total_chunks": total_chunks,
+        "unique_sections_in_chunks": len(unique_sections),
+    }, ensure_ascii=False) + "\n"
+
+
+def _missing_dependencies(details: str):
+    """Response for PDF requests when Docling (or one of its deps) is missing."""
+    return {
+        "success": False,
+        "error": "Missing dependencies",
+        "details": details,
+        "install_instructions": {
+            "docling": "pip install docling",
+            "tesseract": "sudo apt-get install tesseract-ocr tesseract-ocr-ara tesseract-ocr-eng",
+        }
+    }
+
+
+async def _save_upload(file: UploadFile, suffix: str) -> str:
+    """
+    Stream the upload to a temp file in 1 MiB pieces instead of buffering it in memory.
+    The copy runs in a worker thread so the disk writes never block the event loop.
+    """
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        await asyncio.to_thread(shutil.copyfileobj, file.file, tmp, 1 << 20)
+        return tmp.name
+
+
+@app.post("/ingest", response_class=ORJSONResponse)
+async def ingest(file: UploadFile = File(...), stream: bool = True):
     """
     Advanced document ingestion with Docling and proper Arabic support.
     
@@ -493,8 +1125,11 @@ async def ingest(file: UploadFile = File(...)):
     - Proper OCR configuration for RTL languages
     - Layout analysis and table detection (PDF only)
     - Hierarchical section detection
+    
+    Parameters:
+    - stream: Return Docling PDF chunks as NDJSON while they are produced
+      (use stream=false for a single JSON object)
     """
-    content = await file.read()
     file_extension = os.path.splitext(file.filename)[1].lower() if file.filename else ""
     
     # Detect file type
@@ -503,9 +1138,7 @@ async def ingest(file: UploadFile = File(...)):
     
     if is_docx:
         # Process DOCX file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-            tmp.write(content)
-            docx_path = tmp.name
+        docx_path = await _save_upload(file, ".docx")
         
         try:
             result = await _process_docx_file(docx_path)
@@ -514,51 +1147,23 @@ async def ingest(file: UploadFile = File(...)):
         except Exception as e:
             if os.path.exists(docx_path):
                 os.unlink(docx_path)
-            import traceback
-            return {
+            error = {
                 "success": False,
                 "error": str(e),
-                "traceback": traceback.format_exc()
             }
+            if _DEBUG:
+                error["traceback"] = traceback.format_exc()
+            return error
     
     elif is_pdf:
         # Process PDF file (existing logic)
-        # Fix torch.xpu if needed
-        if not hasattr(torch, "xpu"):
-            class FakeXPU:
-                @staticmethod
-                def is_available():
-                    return False
-                @staticmethod
-                def device_count():
-                    return 0
-            torch.xpu = FakeXPU()
-
+        if not _DOCLING_OK:
+            return _missing_dependencies("No module named 'docling'")
+        
         # Save uploaded file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(content)
-            pdf_path = tmp.name
+        pdf_path = await _save_upload(file, ".pdf")
         
         try:
-            from docling.document_converter import DocumentConverter, PdfFormatOption
-            from docling.datamodel.base_models import InputFormat
-            from docling.datamodel.pipeline_options import (
-                PdfPipelineOptions,
-                TesseractOcrOptions,
-            )
-            
-            # Try to import table structure options (may not be available in all versions)
-            try:
-                from docling.datamodel.pipeline_options import (
-                    TableStructureOptions,
-                    TableFormerMode,
-                )
-                HAS_TABLE_OPTIONS = True
-            except ImportError:
-                HAS_TABLE_OPTIONS = False
-                print("  ⚠️  TableStructureOptions not available, using default table settings")
-            from docling.chunking import HybridChunker
-            
             print("\n" + "="*70)
             print("DOCLING PDF PROCESSING WITH ARABIC SUPPORT")
             print("="*70)
@@ -568,66 +1173,6 @@ async def ingest(file: UploadFile = File(...)):
             # ========================================
             print("\n📋 STEP 1: Configuring pipeline for multilingual documents (Arabic, English, French)...")
             
-            # Create pipeline options for PDF with optimal settings for Arabic
-            # Configure table structure options for better Arabic table extraction (if available)
-            table_structure_options = None
-            if HAS_TABLE_OPTIONS:
-                try:
-                    table_structure_options = TableStructureOptions(
-                        # Use accurate mode for better table structure recognition
-                        mode=TableFormerMode.ACCURATE,
-                        # Enable cell matching for better table cell extraction
-                        do_cell_matching=True
-                    )
-                except Exception as e:
-                    print(f"  ⚠️  Could not create TableStructureOptions: {e}")
-                    table_structure_options = None
-            
-            # Build pipeline options dictionary
-            # IMPORTANT: Use force_backend_text to prefer native PDF text over OCR
-            # This avoids tensor padding errors that occur with OCR processing
-            # We'll fallback to OCR if native text extraction fails
-            pipeline_kwargs = {
-                # Try to use native PDF text first (avoids tensor issues)
-                "force_backend_text": True,
-                # Enable OCR as fallback (critical for Arabic documents)
-                "do_ocr": True,
-                # Configure Tesseract for Arabic + English
-                "ocr_options": TesseractOcrOptions(
-                    lang=["ara", "eng", "fra"],  # Arabic + English + French for multilingual documents
-                    # Don't force full page OCR initially (may cause tensor issues)
-                    force_full_page_ocr=False,
-                    # PSM mode 3: Auto page segmentation (more flexible)
-                    psm=3
-                ),
-                # DISABLE table structure detection to avoid tensor errors
-                "do_table_structure": False,
-                # Set lower images scale to reduce memory and tensor issues
-                "images_scale": 1.5,
-                # Disable picture generation to reduce processing
-                "generate_picture_images": False
-            }
-            
-            # Try to add batch sizes if available (may not exist in all versions)
-            # These help process pages one at a time
-            try:
-                # Test if these parameters exist by checking PdfPipelineOptions
-                test_options = PdfPipelineOptions()
-                if hasattr(test_options, 'layout_batch_size'):
-                    pipeline_kwargs["layout_batch_size"] = 1
-                if hasattr(test_options, 'ocr_batch_size'):
-                    pipeline_kwargs["ocr_batch_size"] = 1
-                if hasattr(test_options, 'table_batch_size'):
-                    pipeline_kwargs["table_batch_size"] = 1
-            except:
-                pass
-            
-            # Add table structure options only if available
-            if table_structure_options is not None:
-                pipeline_kwargs["table_structure_options"] = table_structure_options
-            
-            pipeline_options = PdfPipelineOptions(**pipeline_kwargs)
-            
             print("  ✅ OCR enabled with Arabic + English + French support")
             print("  ⚠️  Table structure detection DISABLED (prevents tensor errors)")
             print("  ⚠️  Using force_backend_text to prefer native PDF text")
@@ -638,17 +1183,8 @@ async def ingest(file: UploadFile = File(...)):
             # ========================================
             print("\n📄 STEP 2: Initializing DocumentConverter...")
             
-            # Create format option for PDF
-            pdf_format_option = PdfFormatOption(
-                pipeline_options=pipeline_options
-            )
-            
-            # Initialize converter with format options
-            converter = DocumentConverter(
-                format_options={
-                    InputFormat.PDF: pdf_format_option,
-                }
-            )
+            # Reuses the converter (and its loaded models) from earlier requests
+            converter = _get_converter("primary")
             
             print("  ✅ Converter initialized")
             
@@ -657,105 +1193,101 @@ async def ingest(file: UploadFile = File(...)):
             # ========================================
             print("\n🔄 STEP 3: Converting PDF with Docling...")
             
-            # Try conversion with max_num_pages to process one page at a time if needed
-            try:
-                # First attempt: Try with all pages
-                result = converter.convert(pdf_path)
-                print("  ✅ Conversion successful on first attempt")
-            except Exception as conv_error:
-                error_msg = str(conv_error)
-                print(f"⚠️  Conversion failed, retrying with simpler pipeline...")
-                print(f"   Error: {error_msg[:300]}")
-                
-                # Check if it's a tensor padding error
-                is_tensor_error = "tensor" in error_msg.lower() or "padding" in error_msg.lower()
-                
-                # Fallback: Try with OCR only, no table detection, and process with max_num_pages
-                # This processes pages one at a time to avoid tensor shape mismatches
+            # Set directly when a long PDF is converted in page batches
+            doc = None
+            
+            # Tier 1: text layer only, no OCR. Born-digital PDFs stop here
+            result = await asyncio.to_thread(_convert_fast, pdf_path)
+            pipeline_tier = "fast" if result is not None else "ocr"
+            if result is not None:
+                print("  ⚡ Fast tier: usable text layer found, OCR skipped")
+            else:
+                print("  🔍 Fast tier: text layer missing or too thin, using OCR tier")
+            
+            if result is None:
+                # Try conversion with max_num_pages to process one page at a time if needed
                 try:
-                    print("  🔄 Attempting fallback with OCR-only and page-by-page processing...")
+                    # First attempt: Try with all pages (long PDFs as parallel page batches)
+                    doc = await asyncio.to_thread(_convert_in_page_batches, pdf_path)
+                    if doc is None:
+                        result = await asyncio.to_thread(converter.convert, pdf_path)
+                    print("  ✅ Conversion successful on first attempt")
+                except Exception as conv_error:
+                    error_msg = str(conv_error)
+                    print(f"⚠️  Conversion failed")
+                    print(f"   Error: {error_msg[:300]}")
                     
-                    # Create minimal OCR-only pipeline
-                    minimal_pipeline = PdfPipelineOptions(
-                        do_ocr=True,
-                        ocr_options=TesseractOcrOptions(
-                            lang=["ara", "eng", "fra"],
-                            force_full_page_ocr=True,
-                            psm=6
-                        ),
-                        do_table_structure=False,  # CRITICAL: Disable table detection
-                        images_scale=1.5  # Lower scale to reduce memory usage
-                    )
+                    # The fast tier may have failed in Docling rather than on the
+                    # text layer, so a dense enough native layer is still worth reading
+                    alt_result = await asyncio.to_thread(_run_alternative_method, pdf_path, False)
+                    if _has_usable_text_layer(alt_result):
+                        print("  ✅ Using the native PDF text layer")
+                        os.unlink(pdf_path)
+                        return alt_result
                     
-                    minimal_format = PdfFormatOption(pipeline_options=minimal_pipeline)
-                    minimal_converter = DocumentConverter(
-                        format_options={InputFormat.PDF: minimal_format}
-                    )
+                    print("  🔄 No usable native text layer, retrying with simpler pipeline...")
                     
-                    # Try to convert with max_num_pages to limit processing
-                    # If that doesn't work, try without limit
-                    try:
-                        # Try with a page limit first (processes pages sequentially)
-                        result = minimal_converter.convert(pdf_path, max_num_pages=100)
-                        print("  ✅ Fallback conversion successful with page limit")
-                    except TypeError:
-                        # max_num_pages might not be supported, try without it
-                        result = minimal_converter.convert(pdf_path)
-                        print("  ✅ Fallback conversion successful")
-                        
-                except Exception as fallback_error:
-                    error_msg_fallback = str(fallback_error)
-                    print(f"  ❌ Fallback also failed: {error_msg_fallback[:300]}")
+                    # Check if it's a tensor padding error
+                    is_tensor_error = "tensor" in error_msg.lower() or "padding" in error_msg.lower()
                     
-                    # Final attempt: Try with even simpler configuration
-                    # Remove all optional features that might cause tensor issues
+                    # Fallback: Try with OCR only, no table detection, and process with max_num_pages
+                    # This processes pages one at a time to avoid tensor shape mismatches
                     try:
-                        print("  🔄 Attempting final fallback (ultra-minimal OCR)...")
-                        ultra_minimal = PdfPipelineOptions(
-                            do_ocr=True,
-                            ocr_options=TesseractOcrOptions(
-                                lang=["ara", "eng", "fra"],
-                                force_full_page_ocr=False,  # Try without force_full_page
-                                psm=3  # Auto PSM mode
-                            ),
-                            do_table_structure=False,
-                            images_scale=1.0  # Minimum scale
-                        )
+                        print("  🔄 Attempting fallback with OCR-only and page-by-page processing...")
                         
-                        ultra_format = PdfFormatOption(pipeline_options=ultra_minimal)
-                        ultra_converter = DocumentConverter(
-                            format_options={InputFormat.PDF: ultra_format}
-                        )
+                        minimal_converter = _get_converter("fallback")
                         
-                        result = ultra_converter.convert(pdf_path)
-                        print("  ✅ Ultra-minimal fallback successful")
-                    except Exception as final_error:
-                        # If all fallbacks fail, try using alternative PDF processing
-                        print(f"  ❌ All Docling fallbacks failed. Final error: {str(final_error)[:300]}")
-                        print("  🔄 Attempting alternative PDF processing method...")
+                        # Try to convert with max_num_pages to limit processing
+                        # If that doesn't work, try without limit
+                        try:
+                            # Try with a page limit first (processes pages sequentially)
+                            result = minimal_converter.convert(pdf_path, max_num_pages=100)
+                            print("  ✅ Fallback conversion successful with page limit")
+                        except TypeError:
+                            # max_num_pages might not be supported, try without it
+                            result = minimal_converter.convert(pdf_path)
+                            print("  ✅ Fallback conversion successful")
+                            
+                    except Exception as fallback_error:
+                        error_msg_fallback = str(fallback_error)
+                        print(f"  ❌ Fallback also failed: {error_msg_fallback[:300]}")
                         
-                        # Last resort: Use alternative library for text extraction
+                        # Final attempt: Try with even simpler configuration
+                        # Remove all optional features that might cause tensor issues
                         try:
-                            return await _process_with_alternative_method(pdf_path)
-                        except Exception as alt_error:
-                            print(f"  ❌ Alternative method also failed: {str(alt_error)[:200]}")
-                            # Return a helpful error message
-                            return {
-                                "success": False,
-                                "error": "Docling conversion failed due to tensor padding issues",
-                                "details": "The PDF could not be processed due to tensor shape mismatches. This is a known issue with Docling when processing PDFs with pages of different sizes.",
-                                "suggestion": "Try processing the PDF with a different tool or split it into single-page files.",
-                                "original_error": str(conv_error)[:500]
-                            }
-            
-            if not result or not result.document:
-                return {
-                    "success": False,
-                    "error": "Docling conversion failed",
-                    "details": "Could not extract document content"
-                }
+                            print("  🔄 Attempting final fallback (ultra-minimal OCR)...")
+                            ultra_converter = _get_converter("ultra_minimal")
+                            
+                            result = ultra_converter.convert(pdf_path)
+                            print("  ✅ Ultra-minimal fallback successful")
+                        except Exception as final_error:
+                            # If all fallbacks fail, try using alternative PDF processing
+                            print(f"  ❌ All Docling fallbacks failed. Final error: {str(final_error)[:300]}")
+                            print("  🔄 Attempting alternative PDF processing method...")
+                            
+                            # Last resort: Use alternative library for text extraction
+                            try:
+                                return await _process_with_alternative_method(pdf_path)
+                            except Exception as alt_error:
+                                print(f"  ❌ Alternative method also failed: {str(alt_error)[:200]}")
+                                # Return a helpful error message
+                                return {
+                                    "success": False,
+                                    "error": "Docling conversion failed due to tensor padding issues",
+                                    "details": "The PDF could not be processed due to tensor shape mismatches. This is a known issue with Docling when processing PDFs with pages of different sizes.",
+                                    "suggestion": "Try processing the PDF with a different tool or split it into single-page files.",
+                                    "original_error": str(conv_error)[:500]
+                                }
+            
+            if doc is None:
+                if not result or not result.document:
+                    return {
+                        "success": False,
+                        "error": "Docling conversion failed",
+                        "details": "Could not extract document content"
+                    }
+                doc = result.document
             
-            doc = result.document
             print(f"  ✅ Document converted successfully")
             
             # ========================================
@@ -779,44 +1311,51 @@ async def ingest(file: UploadFile = File(...)):
             # Use a simpler tokenizer that might avoid tensor padding issues
             # Try to use a tokenizer that handles variable lengths better
             try:
-                chunker = HybridChunker(
-                    tokenizer="bert-base-uncased",
-                    max_tokens=600,
-                    overlap_tokens=100,
-                    heading_hierarchies=True,
-                )
+                chunker = _get_chunker(600, 100, True)
             except Exception as chunker_error:
                 print(f"  ⚠️  Error creating chunker: {chunker_error}")
                 print("  🔄 Trying with different tokenizer...")
-                # Fallback: try without heading hierarchies
-                chunker = HybridChunker(
-                    tokenizer="bert-base-uncased",
-                    max_tokens=600,
-                    overlap_tokens=100,
-                    heading_hierarchies=False,  # Disable to avoid potential tensor issues
-                )
+                # Fallback: try without heading hierarchies (avoids potential tensor issues)
+                chunker = _get_chunker(600, 100, False)
             
-            docling_chunks = list(chunker.chunk(doc))
-            print(f"  ✅ Created {len(docling_chunks)} chunks")
+            metadata = {
+                "ocr_engine": "tesseract",
+                "pipeline_tier": pipeline_tier,
+                "languages": ["ara", "eng", "fra"],
+                "table_detection": True,
+                "layout_analysis": True
+            }
+            note = "Processed with Docling's advanced PDF understanding and multilingual OCR (Arabic, English, French)"
             
-            # Convert to our format and clean text
-            chunks = []
-            for dc in docling_chunks:
-                # Clean the text to remove unnecessary newlines
-                cleaned_text = clean_text(dc.text)
-                chunk_dict = {
-                    "text": cleaned_text,
-                    "page": dc.meta.get("page"),
-                    "docling_section": dc.meta.get("headings", [None])[0] if dc.meta.get("headings") else None
+            if stream:
+                # Chunking, section assignment and serialization all run lazily
+                # while the response is written; the document is already in memory
+                header = {
+                    "success": True,
+                    "method": "docling_with_arabic_ocr",
+                    "detected_sections": sections,
+                    "sections_count": len(sections),
+                    "metadata": metadata,
+                    "note": note
                 }
-                chunks.append(chunk_dict)
+                os.unlink(pdf_path)
+                return StreamingResponse(
+                    stream_chunks(header, iter_sections_to_chunks(
+                        _iter_docling_chunks(doc, chunker), sections
+                    )),
+                    media_type="application/x-ndjson"
+                )
+            
+            # Convert to our format and clean text
+            chunks = list(_iter_docling_chunks(doc, chunker))
+            print(f"  ✅ Created {len(chunks)} chunks")
             
             # ========================================
             # STEP 6: Assign sections
             # ========================================
             print("\n🎯 STEP 6: Assigning sections to chunks...")
             
-            enriched_chunks = assign_sections_to_chunks(chunks, sections)
+            enriched_chunks, unique_sections = assign_sections_to_chunks(chunks, sections)
             
             # Show sample
             if enriched_chunks:
@@ -826,7 +1365,6 @@ async def ingest(file: UploadFile = File(...)):
                 print(f"  Text: {enriched_chunks[0]['text'][:150]}...")
             
             # Quality check
-            unique_sections = set(c['meta']['section'] for c in enriched_chunks)
             print(f"\n✅ Quality check:")
             print(f"  - Total chunks: {len(enriched_chunks)}")
             print(f"  - Unique sections: {len(unique_sections)}")
@@ -842,39 +1380,27 @@ async def ingest(file: UploadFile = File(...)):
                 "sections_count": len(sections),
                 "unique_sections_in_chunks": len(unique_sections),
                 "chunks": enriched_chunks,
-            "metadata": {
-                "ocr_engine": "tesseract",
-                "languages": ["ara", "eng", "fra"],
-                "table_detection": True,
-                "layout_analysis": True
-            },
-            "note": "Processed with Docling's advanced PDF understanding and multilingual OCR (Arabic, English, French)"
+                "metadata": metadata,
+                "note": note
             }
         
         except ImportError as e:
             if os.path.exists(pdf_path):
                 os.unlink(pdf_path)
             
-            return {
-                "success": False,
-                "error": "Missing dependencies",
-                "details": str(e),
-                "install_instructions": {
-                    "docling": "pip install docling",
-                    "tesseract": "sudo apt-get install tesseract-ocr tesseract-ocr-ara tesseract-ocr-eng",
-                }
-            }
+            return _missing_dependencies(str(e))
         
         except Exception as e:
             if os.path.exists(pdf_path):
                 os.unlink(pdf_path)
             
-            import traceback
-            return {
+            error = {
                 "success": False,
                 "error": str(e),
-                "traceback": traceback.format_exc()
             }
+            if _DEBUG:
+                error["traceback"] = traceback.format_exc()
+            return error
     else:
         return {
             "success": False,
@@ -902,7 +1428,7 @@ async def health():
         pass
     
     try:
-        import pytesseract
+        pytesseract = _get_pytesseract()
         version = pytesseract.get_tesseract_version()
         status["tesseract"] = True
         status["tesseract_version"] = str(version)
@@ -1,18 +1,20 @@
 from fastapi import FastAPI, UploadFile, File
+from fastapi.responses import ORJSONResponse
 import tempfile, os
-import PyPDF2
 from io import BytesIO
 import re
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+    import PyPDF2
 
 app = FastAPI()
 
-def detect_sections_in_text(text: str) -> List[Dict]:
-    """Detect sections in text using heading patterns"""
-    sections = []
-    
-    # Common heading patterns
-    heading_patterns = [
+# Common heading patterns; each is matched against a single stripped line
+_HEADING_PATTERNS = [
     # =========================
     # Numbered sections
     # =========================
@@ -44,59 +46,74 @@ def detect_sections_in_text(text: str) -> List[Dict]:
     r'^[\u0600-\u06FF\s]{3,40}$',       # Short Arabic-only line
 ]
 
+# One alternation so a single match() decides heading-or-not per line
+_HEADING_RE = re.compile("|".join(f"(?:{p})" for p in _HEADING_PATTERNS))
+_LINE_RE = re.compile(r'[^\n]+')
+
+def detect_sections_in_text(text: str) -> List[Dict]:
+    """Detect sections in text using heading patterns"""
+    sections = []
     
-    lines = text.split('\n')
     current_section = "Document"
     
-    for line in lines:
-        line = line.strip()
+    for line_match in _LINE_RE.finditer(text):
+        line = line_match.group().strip()
         if not line:
             continue
             
         # Check if line matches any heading pattern
-        is_heading = False
-        for pattern in heading_patterns:
-            if re.match(pattern, line, re.MULTILINE):
-                current_section = line
-                is_heading = True
-                break
+        if _HEADING_RE.match(line):
+            current_section = line
+            continue
         
-        if not is_heading and line:
-            sections.append({
-                "text": line,
-                "section": current_section
-            })
+        sections.append({
+            "text": line,
+            "section": current_section
+        })
     
     return sections
 
-def extract_text_with_enhanced_pypdf2(pdf_content: bytes) -> List[Dict]:
-    """Extract text with section detection"""
-    text_by_page = []
-    
-    try:
+def _is_image_only(page) -> bool:
+    """True for scanned pages: images but no fonts, so there is no text layer to extract"""
+    return not page.get_fonts() and bool(page.get_images())
+
+def _iter_page_texts(pdf_content: bytes, skip_empty_text_pages: bool = True) -> Iterator[str]:
+    """
+    Yield each page's text, with PyMuPDF when installed and PyPDF2 otherwise.
+    With skip_empty_text_pages, image-only pages yield "" without running text extraction.
+    """
+    if fitz is None:
         pdf_reader = PyPDF2.PdfReader(BytesIO(pdf_content))
-        
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text = page.extract_text()
+        for page in pdf_reader.pages:
+            yield page.extract_text() or ""
+        return
+    
+    with fitz.open(stream=pdf_content, filetype="pdf") as doc:
+        for page in doc:
+            if skip_empty_text_pages and _is_image_only(page):
+                yield ""
+            else:
+                yield page.get_text("text")
+
+def extract_text_with_enhanced_pymupdf(pdf_content: bytes, skip_empty_text_pages: bool = True) -> Iterator[Dict]:
+    """
+    Extract text with section detection.
+    Yields one {page, text, section} dict per body line, page by page, so the
+    chunker consumes lines as they are produced; extraction errors propagate.
+    """
+    for page_num, text in enumerate(_iter_page_texts(pdf_content, skip_empty_text_pages)):
+        if text.strip():
+            # Detect sections in this page's text
+            sections = detect_sections_in_text(text)
             
-            if text.strip():
-                # Detect sections in this page's text
-                sections = detect_sections_in_text(text)
-                
-                for section_data in sections:
-                    text_by_page.append({
-                        "page": page_num + 1,
-                        "text": section_data["text"],
-                        "section": section_data["section"]
-                    })
-        
-        return text_by_page
-    except Exception as e:
-        print(f"Enhanced PyPDF2 extraction error: {e}")
-        return None
+            for section_data in sections:
+                yield {
+                    "page": page_num + 1,
+                    "text": section_data["text"],
+                    "section": section_data["section"]
+                }
 
-def chunk_text_with_sections(text_pages: List[Dict], chunk_size: int = 600, overlap: int = 100) -> List[Dict]:
+def chunk_text_with_sections(text_pages: Iterable[Dict], chunk_size: int = 600, overlap: int = 100) -> List[Dict]:
     """Chunk text while preserving section information"""
     chunks = []
     
@@ -104,7 +121,13 @@ def chunk_text_with_sections(text_pages: List[Dict], chunk_size: int = 600, over
     current_chunk = ""
     current_section = None
     current_page = 1
+    
+    # Words of the pending chunk are chunk_words[base:]; emitting a chunk only
+    # advances base, and the consumed prefix is dropped once it outgrows a chunk
     chunk_words = []
+    base = 0
+    # At least one word per step, or overlap >= chunk_size would never advance
+    step = max(1, chunk_size - overlap) if overlap > 0 else chunk_size
     
     for item in text_pages:
         text = item["text"]
@@ -115,8 +138,8 @@ def chunk_text_with_sections(text_pages: List[Dict], chunk_size: int = 600, over
         
         # If section changes, force a new chunk
         if section != current_section and current_chunk:
-            if chunk_words:
-                chunk_text = " ".join(chunk_words)
+            if len(chunk_words) > base:
+                chunk_text = " ".join(chunk_words[base:])
                 chunks.append({
                     "text": chunk_text,
                     "meta": {
@@ -125,35 +148,34 @@ def chunk_text_with_sections(text_pages: List[Dict], chunk_size: int = 600, over
                     }
                 })
             chunk_words = []
+            base = 0
             current_chunk = ""
         
         current_section = section
         current_page = page
         
         # Add words to current chunk
-        for word in words:
-            chunk_words.append(word)
-            
-            # Check if we've reached chunk size
-            if len(chunk_words) >= chunk_size:
-                chunk_text = " ".join(chunk_words[:chunk_size])
-                chunks.append({
-                    "text": chunk_text,
-                    "meta": {
-                        "page": page,
-                        "section": section
-                    }
-                })
-                
-                # Keep overlap for next chunk
-                if overlap > 0:
-                    chunk_words = chunk_words[chunk_size - overlap:]
-                else:
-                    chunk_words = []
+        chunk_words.extend(words)
+        
+        # Emit every full chunk, keeping overlap for the next one
+        while len(chunk_words) - base >= chunk_size:
+            chunk_text = " ".join(chunk_words[base:base + chunk_size])
+            chunks.append({
+                "text": chunk_text,
+                "meta": {
+                    "page": page,
+                    "section": section
+                }
+            })
+            base += step
+        
+        if base >= chunk_size:
+            del chunk_words[:base]
+            base = 0
     
     # Add remaining words
-    if chunk_words:
-        chunk_text = " ".join(chunk_words)
+    if len(chunk_words) > base:
+        chunk_text = " ".join(chunk_words[base:])
         chunks.append({
             "text": chunk_text,
             "meta": {
@@ -164,20 +186,22 @@ def chunk_text_with_sections(text_pages: List[Dict], chunk_size: int = 600, over
     
     return chunks
 
-@app.post("/ingest")
+@app.post("/ingest", response_class=ORJSONResponse)
 async def ingest(file: UploadFile = File(...)):
     content = await file.read()
     
-    # Extract text with enhanced section detection
-    text_pages = extract_text_with_enhanced_pypdf2(content)
+    # Extract text with enhanced section detection, streamed straight into the chunker
+    try:
+        chunks = chunk_text_with_sections(extract_text_with_enhanced_pymupdf(content))
+    except Exception as e:
+        print(f"Enhanced PDF extraction error: {e}")
+        chunks = None
     
-    if text_pages:
-        chunks = chunk_text_with_sections(text_pages)
-        
+    if chunks:
         return {
             "success": True,
             "chunks": chunks,
-            "method": "enhanced_pypdf2",
+            "method": "enhanced_pymupdf" if fitz is not None else "enhanced_pypdf2",
             "total_chunks": len(chunks)
         }
     
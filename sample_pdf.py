@@ -1,12 +1,70 @@
 from fastapi import FastAPI, UploadFile, File
+from fastapi.responses import ORJSONResponse
 import tempfile, os
-from io import BytesIO
-import PyPDF2
-import torch
+import asyncio
+import shutil
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import re
 
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+    import PyPDF2
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    from tesserocr import PyTessBaseAPI
+except ImportError:
+    PyTessBaseAPI = None
+
 app = FastAPI()
 
+# Text extraction fans out over page ranges only for PDFs long enough to
+# amortize the worker hand-off; OCR runs one Tesseract instance per thread
+PAGE_EXTRACT_MIN_PAGES = 32
+PAGE_EXTRACT_WORKERS = max(1, os.cpu_count() or 1)
+OCR_CONCURRENCY = int(os.environ.get('OCR_CONCURRENCY', os.cpu_count() or 1))
+
+_NUMBERED_RE = re.compile(r'^(\d+|[٠-٩]+)[\.\-\:]\s*.+')
+_BULLET_RE = re.compile(r'^[•\-\*\+]\s*')
+# Arabic diacritics (harakat), deleted in one C-level pass by str.translate
+_DIACRITICS_TABLE = str.maketrans('', '', 'ًٌٍَُِّْ')
+_LINE_RE = re.compile(r'[^\n]+')
+# Matches as soon as a line holds at least 4 Arabic characters, without scanning the rest
+_ARABIC_4_RE = re.compile(r'(?:[^\u0600-\u06FF]*[\u0600-\u06FF]){4}')
+
+# Common Arabic/English heading words
+_HEADING_KEYWORDS = [
+    # Arabic (various forms)
+    'الوحدة', 'وحدة', 'الفصل', 'فصل', 'المقدمة', 'مقدمة',
+    'الخاتمة', 'خاتمة', 'الأهداف', 'أهداف', 'المنهجية', 'منهجية',
+    'التقويم', 'تقويم', 'الباب', 'باب', 'القسم', 'قسم',
+    'الجزء', 'جزء', 'الفرع', 'فرع', 'الدرس', 'درس',
+    
+    # English
+    'CHAPTER', 'UNIT', 'SECTION', 'INTRODUCTION', 'CONCLUSION',
+    'OBJECTIVES', 'METHODOLOGY', 'ASSESSMENT', 'LESSON',
+]
+
+# All keywords matched in a single pass over the lowered line
+if ahocorasick is not None:
+    _KEYWORDS_AC = ahocorasick.Automaton()
+    for _keyword in _HEADING_KEYWORDS:
+        _KEYWORDS_AC.add_word(_keyword.lower(), _keyword)
+    _KEYWORDS_AC.make_automaton()
+    _KEYWORDS_RE = None
+else:
+    _KEYWORDS_AC = None
+    _KEYWORDS_RE = re.compile('|'.join(re.escape(k.lower()) for k in _HEADING_KEYWORDS))
+
 
 def is_likely_heading(line, debug=False):
     """
@@ -17,57 +75,50 @@ def is_likely_heading(line, debug=False):
     if not line or len(line) > 200:
         return False
     
+    reason = _heading_reason(line)
+    if reason and debug:
+        print(f"  ✅ Found {reason}: {line[:50]}...")
+    return reason is not None
+
+
+@functools.lru_cache(maxsize=4096)
+def _heading_reason(line):
+    """
+    Which heading strategy matches a stripped, length-gated line, or None.
+    Memoized: running headers and footers repeat on every page.
+    """
     # Strategy 1: Common Arabic/English heading words
-    heading_keywords = [
-        # Arabic (various forms)
-        'الوحدة', 'وحدة', 'الفصل', 'فصل', 'المقدمة', 'مقدمة',
-        'الخاتمة', 'خاتمة', 'الأهداف', 'أهداف', 'المنهجية', 'منهجية',
-        'التقويم', 'تقويم', 'الباب', 'باب', 'القسم', 'قسم',
-        'الجزء', 'جزء', 'الفرع', 'فرع', 'الدرس', 'درس',
-        
-        # English
-        'CHAPTER', 'UNIT', 'SECTION', 'INTRODUCTION', 'CONCLUSION',
-        'OBJECTIVES', 'METHODOLOGY', 'ASSESSMENT', 'LESSON',
-    ]
-    
     line_lower = line.lower()
-    for keyword in heading_keywords:
-        if keyword.lower() in line_lower:
-            if debug:
-                print(f"  ✅ Found keyword '{keyword}' in: {line[:50]}...")
-            return True
+    if _KEYWORDS_AC is not None:
+        keyword = next((k for _, k in _KEYWORDS_AC.iter(line_lower)), None)
+    else:
+        match = _KEYWORDS_RE.search(line_lower)
+        keyword = match.group() if match else None
+    if keyword:
+        return f"keyword '{keyword}' in"
     
     # Strategy 2: Numbered headings (1., 2., etc or ١., ٢., etc)
-    if re.match(r'^(\d+|[٠-٩]+)[\.\-\:]\s*.+', line):
-        if debug:
-            print(f"  ✅ Found numbered heading: {line[:50]}...")
-        return True
+    if _NUMBERED_RE.match(line):
+        return "numbered heading"
     
     # Strategy 3: Short lines (likely titles) - but not too short
     if 10 < len(line) < 100:
         # Check if it contains Arabic characters
-        arabic_count = sum(1 for c in line if '\u0600' <= c <= '\u06FF')
-        if arabic_count > 3:  # At least 3 Arabic chars
+        if _ARABIC_4_RE.match(line):  # More than 3 Arabic chars
             # Should not end with common sentence endings
             if not line.endswith(('.', '،', '؛', '!')):
-                if debug:
-                    print(f"  ✅ Found short Arabic line: {line[:50]}...")
-                return True
+                return "short Arabic line"
     
     # Strategy 4: Lines with colons (often headings)
     if ':' in line or '：' in line:
         if len(line) < 150:
-            if debug:
-                print(f"  ✅ Found colon heading: {line[:50]}...")
-            return True
+            return "colon heading"
     
     # Strategy 5: All CAPS lines (short)
     if len(line) < 100 and line.isupper() and len(line) > 5:
-        if debug:
-            print(f"  ✅ Found CAPS heading: {line[:50]}...")
-        return True
+        return "CAPS heading"
     
-    return False
+    return None
 
 
 def extract_sections_from_text(text, debug=False):
@@ -76,19 +127,19 @@ def extract_sections_from_text(text, debug=False):
     Returns list of section titles.
     """
     sections = []
-    lines = text.split('\n')
     
     if debug:
-        print(f"\n📄 Processing {len(lines)} lines...")
+        line_count = text.count('\n') + 1
+        print(f"\n📄 Processing {line_count} lines...")
     
-    for i, line in enumerate(lines):
-        line = line.strip()
+    for line_match in _LINE_RE.finditer(text):
+        line = line_match.group().strip()
         if not line:
             continue
             
         if is_likely_heading(line, debug=debug):
             # Clean up the line
-            section = re.sub(r'^[•\-\*\+]\s*', '', line)  # Remove bullets
+            section = _BULLET_RE.sub('', line)  # Remove bullets
             section = section.strip()
             
             if section and len(section) > 3:
@@ -102,13 +153,108 @@ def extract_sections_from_text(text, debug=False):
     return sections
 
 
-def extract_text_with_pypdf2(pdf_content):
-    """Extract text using PyPDF2"""
+def _is_image_only(page):
+    """True for scanned pages: images but no fonts, so there is no text layer to extract."""
+    return not page.get_fonts() and bool(page.get_images())
+
+
+def _extract_page_range(args):
+    """
+    Worker: PyMuPDF text of pages [start, stop) of the PDF at pdf_path.
+    Image-only pages come back empty without running text extraction when skipped.
+    """
+    pdf_path, start, stop, skip_empty_text_pages = args
+    texts = []
+    with fitz.open(pdf_path) as doc:
+        for i in range(start, stop):
+            page = doc.load_page(i)
+            if skip_empty_text_pages and _is_image_only(page):
+                texts.append("")
+            else:
+                texts.append(page.get_text("text"))
+    return texts
+
+
+@functools.lru_cache(maxsize=1)
+def _get_page_pool():
+    """
+    Long-lived pool for page-range extraction.
+    Spawned, not forked: the parent may hold torch thread pools once Docling has run.
+    """
+    return ProcessPoolExecutor(
+        max_workers=PAGE_EXTRACT_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+# Per-thread Tesseract instance (tesserocr), created on first use in each OCR thread
+_tess_local = threading.local()
+
+
+def _get_tess_api():
+    """
+    Return this thread's Tesseract API so traineddata is loaded only once per thread.
+    """
+    api = getattr(_tess_local, "api", None)
+    if api is None:
+        api = _tess_local.api = PyTessBaseAPI(lang='ara+eng')
+    return api
+
+
+def _render_page(page, dpi=200):
+    """
+    Rasterize a PyMuPDF page straight into a PIL image (no pdftoppm subprocess or PPM files).
+    """
+    from PIL import Image
+    
+    pix = page.get_pixmap(dpi=dpi)
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
+def _ocr_image(image):
+    """OCR one page image, through a warm tesserocr API when available."""
+    if PyTessBaseAPI is not None:
+        api = _get_tess_api()
+        api.SetImage(image)
+        return api.GetUTF8Text()
+    
+    import pytesseract
+    return pytesseract.image_to_string(image, lang='ara+eng')
+
+
+@functools.lru_cache(maxsize=1)
+def _get_ocr_pool():
+    """
+    Long-lived OCR threads, so each keeps its Tesseract API loaded across requests.
+    """
+    return ThreadPoolExecutor(max_workers=OCR_CONCURRENCY)
+
+
+def extract_text_with_pymupdf(pdf_path, skip_empty_text_pages=True):
+    """
+    Extract text using PyMuPDF, falling back to PyPDF2 if it is not installed.
+    skip_empty_text_pages: don't run text extraction on scanned (image-only) pages.
+    """
     pages = []
     try:
-        reader = PyPDF2.PdfReader(BytesIO(pdf_content))
-        for i, page in enumerate(reader.pages):
-            text = page.extract_text() or ""
+        if fitz is None:
+            reader = PyPDF2.PdfReader(pdf_path)
+            page_texts = [page.extract_text() or "" for page in reader.pages]
+        else:
+            with fitz.open(pdf_path) as doc:
+                page_count = doc.page_count
+            
+            if page_count >= PAGE_EXTRACT_MIN_PAGES and PAGE_EXTRACT_WORKERS > 1:
+                # One contiguous page range per worker; each reopens the file itself
+                step = -(-page_count // PAGE_EXTRACT_WORKERS)
+                ranges = [(pdf_path, start, min(start + step, page_count), skip_empty_text_pages)
+                          for start in range(0, page_count, step)]
+                page_texts = [text for texts in _get_page_pool().map(_extract_page_range, ranges)
+                              for text in texts]
+            else:
+                page_texts = _extract_page_range((pdf_path, 0, page_count, skip_empty_text_pages))
+        
+        for i, text in enumerate(page_texts):
             if text.strip():
                 pages.append({
                     "page": i + 1,
@@ -116,7 +262,7 @@ def extract_text_with_pypdf2(pdf_content):
                 })
         return pages
     except Exception as e:
-        print(f"PyPDF2 error: {e}")
+        print(f"PDF text extraction error: {e}")
         return None
 
 
@@ -155,26 +301,41 @@ def assign_sections_to_chunks(chunks_data, all_sections):
     enriched = []
     current_section = all_sections[0]  # Start with first section
     
+    # Create a simple version of every section once (remove diacritics, etc);
+    # the simplified test also covers the raw one
+    sections_simple = [section.translate(_DIACRITICS_TABLE) for section in all_sections]
+    
+    # One automaton over all sections; values keep list order so the
+    # earliest listed section still wins when several match
+    automaton = None
+    if ahocorasick is not None and all(sections_simple):
+        automaton = ahocorasick.Automaton()
+        for idx, section_simple in enumerate(sections_simple):
+            if section_simple not in automaton:
+                automaton.add_word(section_simple, idx)
+        automaton.make_automaton()
+    
     print(f"\n📊 Assigning {len(all_sections)} sections to {len(chunks_data)} chunks...")
     
     for chunk_idx, chunk in enumerate(chunks_data):
-        chunk_text = chunk["text"]
+        # Try to find section in first 500 chars of chunk
+        search_simple = chunk["text"][:500].translate(_DIACRITICS_TABLE)
         matched_section = None
         
         # Check if this chunk contains any section title
-        for section in all_sections:
-            # Try to find section in first 500 chars of chunk
-            search_text = chunk_text[:500]
-            
-            # Create a simple version for matching (remove diacritics, etc)
-            section_simple = re.sub(r'[ًٌٍَُِّْ]', '', section)  # Remove Arabic diacritics
-            search_simple = re.sub(r'[ًٌٍَُِّْ]', '', search_text)
-            
-            if section_simple in search_simple or section in search_text:
-                matched_section = section
-                current_section = section
-                print(f"  ✅ Chunk {chunk_idx}: Matched section: {section[:50]}...")
-                break
+        if automaton is not None:
+            hits = [idx for _, idx in automaton.iter(search_simple)]
+            if hits:
+                matched_section = all_sections[min(hits)]
+        else:
+            for section, section_simple in zip(all_sections, sections_simple):
+                if section_simple in search_simple:
+                    matched_section = section
+                    break
+        
+        if matched_section:
+            current_section = matched_section
+            print(f"  ✅ Chunk {chunk_idx}: Matched section: {matched_section[:50]}...")
         
         # If no match found, use current section
         if not matched_section:
@@ -194,7 +355,7 @@ def assign_sections_to_chunks(chunks_data, all_sections):
 # ----------------------------
 # FastAPI endpoint
 # ----------------------------
-@app.post("/ingest")
+@app.post("/ingest", response_class=ORJSONResponse)
 async def ingest(file: UploadFile = File(...), use_ocr: bool = False, debug: bool = False):
     """
     Ingest PDF and extract chunks with sections.
@@ -203,20 +364,10 @@ async def ingest(file: UploadFile = File(...), use_ocr: bool = False, debug: boo
     - use_ocr: Enable OCR (requires pytesseract)
     - debug: Enable debug output to see what's being detected
     """
-    content = await file.read()
-
-    if not hasattr(torch, "xpu"):
-        class FakeXPU:
-            @staticmethod
-            def is_available():
-                return False
-            @staticmethod
-            def device_count():
-                return 0
-        torch.xpu = FakeXPU()
-
+    # Stream the upload to disk in 1 MiB pieces (off the event loop) instead of
+    # buffering it in memory; every extractor below reads from the file
     with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(content)
+        await asyncio.to_thread(shutil.copyfileobj, file.file, tmp, 1 << 20)
         pdf_path = tmp.name
 
     try:
@@ -229,15 +380,26 @@ async def ingest(file: UploadFile = File(...), use_ocr: bool = False, debug: boo
         # ----------------------------
         if use_ocr:
             try:
-                from pdf2image import convert_from_path
-                import pytesseract
+                if PyTessBaseAPI is None:
+                    import pytesseract
                 
                 print("🔍 Using OCR for text extraction...")
-                images = convert_from_path(pdf_path, dpi=200)
+                
+                # tesserocr releases the GIL and pytesseract runs a tesseract
+                # process per call, so threads give real parallelism either way
+                if fitz is not None:
+                    # Render pages in-process and hand each to the pool as soon
+                    # as it is ready, so OCR overlaps rendering
+                    with fitz.open(pdf_path) as doc:
+                        futures = [_get_ocr_pool().submit(_ocr_image, _render_page(page)) for page in doc]
+                    ocr_texts = [future.result() for future in futures]
+                else:
+                    from pdf2image import convert_from_path
+                    images = convert_from_path(pdf_path, dpi=200)
+                    ocr_texts = list(_get_ocr_pool().map(_ocr_image, images))
                 
                 text_pages = []
-                for i, image in enumerate(images):
-                    text = pytesseract.image_to_string(image, lang='ara+eng')
+                for i, text in enumerate(ocr_texts):
                     if text.strip():
                         text_pages.append({
                             "page": i + 1,
@@ -261,6 +423,19 @@ async def ingest(file: UploadFile = File(...), use_ocr: bool = False, debug: boo
         # ----------------------------
         if not text_pages:
             try:
+                # Only the Docling branch needs torch, so load it here; this also
+                # keeps it out of the spawned page-extraction workers
+                import torch
+                if not hasattr(torch, "xpu"):
+                    class FakeXPU:
+                        @staticmethod
+                        def is_available():
+                            return False
+                        @staticmethod
+                        def device_count():
+                            return 0
+                    torch.xpu = FakeXPU()
+                
                 from docling.document_converter import DocumentConverter
                 from docling.chunking import HybridChunker
                 from docling.datamodel.pipeline_options import PdfPipelineOptions
@@ -317,19 +492,19 @@ async def ingest(file: UploadFile = File(...), use_ocr: bool = False, debug: boo
                 print(f"Docling failed: {e}")
         
         # ----------------------------
-        # PyPDF2 Fallback
+        # PyMuPDF / PyPDF2 Fallback
         # ----------------------------
         if not text_pages:
-            print("🔍 Using PyPDF2 for text extraction...")
-            text_pages = extract_text_with_pypdf2(content)
-            method = "pypdf2"
+            method = "pymupdf" if fitz is not None else "pypdf2"
+            print(f"🔍 Using {method} for text extraction...")
+            text_pages = extract_text_with_pymupdf(pdf_path)
         
         if text_pages:
             # Combine all text
             all_text = "\n".join([p["text"] for p in text_pages])
             
             if debug:
-                print(f"\n📄 PyPDF2 Sample (first 500 chars):")
+                print(f"\n📄 {method} Sample (first 500 chars):")
                 print(all_text[:500])
                 print("...\n")
             
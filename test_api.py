@@ -44,6 +44,8 @@ def test_ingest(pdf_path):
             response = requests.post(
                 f"{BASE_URL}/ingest",
                 files=files,
+                # /ingest streams NDJSON by default; ask for a single JSON object
+                params={"stream": "false"},
                 timeout=300  # 5 minutes timeout pour le traitement
             )
         
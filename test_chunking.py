@@ -0,0 +1,89 @@
+"""
+Tests hors-ligne du découpage en chunks (pas besoin de serveur)
+"""
+import importlib.util
+import os
+import re
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("torch")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _load(filename, name):
+    """Importe un module du dépôt par chemin (certains noms contiennent des espaces)"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+main = _load("main.py", "main")
+minimalist = _load("main text only minimalist.py", "main_text_only_minimalist")
+custom_sections = _load("main_simple_custom_sections.py", "main_simple_custom_sections")
+
+
+def stride_chunks(text, chunk_size, overlap):
+    """Ancienne boucle à pas fixe : une fenêtre par offset de départ"""
+    spans = [m.span() for m in re.finditer(r'\S+', text)]
+    chunks = []
+    for i in range(0, len(spans), chunk_size - overlap):
+        end = min(i + chunk_size, len(spans))
+        chunks.append(text[spans[i][0]:spans[end - 1][1]])
+    return chunks
+
+
+def _page(n_words):
+    return " ".join(f"w{i}" for i in range(n_words))
+
+
+@pytest.mark.parametrize("n_words", [0, 1, 5, 40, 45, 48, 50, 51, 90, 130, 131])
+def test_windows_match_stride_loop(n_words):
+    text = _page(n_words)
+    expected = stride_chunks(text, 50, 10)
+
+    chunks = minimalist.chunk_text([{"page": 1, "text": text}], chunk_size=50, overlap=10)
+    assert [c["text"] for c in chunks] == expected
+
+    pages = [{"page": 1, "text": text}]
+    chunks = list(main.iter_enriched_chunks(pages, [], chunk_size=50, overlap=10))
+    assert [c["text"] for c in chunks] == expected
+
+
+def test_chunk_takes_last_heading_in_its_first_400_chars():
+    # The second window starts before the "Beta:" heading, and its prefix also
+    # quotes "Alpha:" inside a long (non-heading) line
+    text = (
+        "Alpha:\n" + " ".join(["x"] * 30) + "\n"
+        "Beta:\n" + "see Alpha: " + " ".join(["y"] * 150)
+    )
+    sections = []
+    chunks = list(main.iter_enriched_chunks([{"page": 1, "text": text}], sections,
+                                            chunk_size=20, overlap=5))
+
+    assert sections == ["Alpha:", "Beta:"]
+    assert chunks[1]["text"].startswith("x ")
+    assert "Beta:\nsee Alpha:" in chunks[1]["text"][:400]
+    # Not the first listed section found in the prefix, but the heading in effect
+    assert [c["meta"]["section"] for c in chunks[:3]] == ["Alpha:", "Beta:", "Beta:"]
+
+
+def test_chunk_ignores_headings_past_its_first_400_chars():
+    text = "Alpha:\n" + " ".join(["word"] * 100) + "\nBeta:\n" + " ".join(["word"] * 10)
+    chunks = list(main.iter_enriched_chunks([{"page": 1, "text": text}], []))
+
+    assert len(chunks) == 1
+    assert chunks[0]["meta"]["section"] == "Alpha:"
+
+
+@pytest.mark.parametrize("overlap", [10, 15])
+def test_overlap_not_below_chunk_size_still_advances(overlap):
+    pages = [{"page": 1, "section": "A", "text": _page(30)}]
+    chunks = custom_sections.chunk_text_with_sections(pages, chunk_size=10, overlap=overlap)
+
+    # One word per step: windows start at w0 .. w20, plus the trailing remainder
+    assert len(chunks) == 22
+    assert chunks[1]["text"].startswith("w1 ")
@@ -30,6 +30,8 @@ def test_ingest():
             response = requests.post(
                 f"{BASE_URL}/ingest",
                 files=files,
+                # /ingest streams NDJSON by default; ask for a single JSON object
+                params={"stream": "false"},
                 timeout=600  # 10 minutes timeout pour le traitement
             )
         